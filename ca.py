@@ -11,28 +11,34 @@
 import time
 import datetime
 import json
+import hashlib
+import zlib
 import sys
 import logging
+import threading
 from platform import uname
 from PySide2.QtWidgets import QApplication
 from PySide2.QtGui import QIcon
-from PySide2.QtCore import QTimer, Slot, QThread, Signal, QObject
-import keyboard
-import mouse
+from PySide2.QtCore import QTimer, Slot, QThread, Signal, QObject, Qt
 from PIL import ImageGrab
 from psutil import WINDOWS, LINUX
 
 from constants import (
     APP_NAME,
-    HA_TOPIC,
+    TOPIC_APP_NAME,
+    HA_DISCOVERY_PREFIX,
     BASE_TOPIC,
     MQTT_TIMEOUT,
     Status,
+    CapturePolicy,
     DEFAULT_SETTINGS,
     CA_ICON,
     CA_WARNING_ICON,
     CA_CRITICAL_ICON,
-    CA_SETTINGS
+    CA_SETTINGS,
+    CA_DISCOVERY_CACHE,
+    CA_LOG,
+    CA_TRACE
 )
 
 # import constants
@@ -40,21 +46,64 @@ from settings import JSONSettings, SettingsDialog
 from systray import SystemTrayIcon
 from microsoft import windows
 from imageprocess import convert
-from mqtt import Mqtt, ConnectionStatus
+from imageprocess.chunks import ChunkWriter
+from mqtt import Mqtt, QtMqtt, ConnectionStatus, Broker
+from scheduler import AdaptiveScheduler
+from idle import IdleSource, create_idle_source
+from discovery import Entity, HADiscovery
+from memory import MemoryBudget, LeakSentinel
+import logs
+from eventtrace import TraceRecorder
+from stream import MjpegServer
+from notifications import NotificationQueue
+from watcher import WindowWatcher
+from sensors import SystemSensors
+from history import FrameHistory
+
+
+logger = logging.getLogger(__name__)
 
 
 class ComputerAssistant(QObject):
     attempt_reconnect = Signal()
+    screenshot_requested = Signal()
+    discovery_requested = Signal()
+    chunks_published = Signal(object)
 
-    def __init__(self, computer_name: str):
+    def __init__(self, computer_name: str, idle_source: IdleSource = None,
+                 clock=datetime.datetime.now):
         super().__init__()
-        self._ltu = datetime.datetime.now()
+        # clock is replaced by a virtual clock when replaying a trace
+        self.clock = clock
+        self._ltu = self.clock()
         self._ptu = self._ltu
         # frequency to check for activity and active timeout
         self._freq = 15
+        self._effective_freq = 15
         self._active_timeout = 120
         self.timer = QTimer()
         self.freq = 15
+        # adapts the capture interval when enabled
+        self.scheduler = None
+        # message info of the last screenshot published
+        self.screenshot_info = None
+        # records a trace of events for replay when set
+        self.recorder = None
+        # url of the mjpeg stream, replaces the mqtt camera when set
+        self.stream_url = None
+        # capture every tick or on foreground window change with the tick
+        # as a fallback every fallback_freq seconds
+        self.capture_policy = CapturePolicy.TICK
+        self.fallback_freq = 300
+        self._last_capture = None
+        # host health sensors when enabled
+        self.system_sensors = None
+        # publish screenshots in chunks of this many bytes, 0 disables
+        self.screenshot_chunk_size = 0
+        # sends the chunks of a screenshot without blocking the qt thread
+        self.chunk_thread = None
+        # recent screenshots when enabled
+        self.history = None
         # get computer name to use as unique id and within mqtt topics
         self.computer_name = computer_name
 
@@ -65,18 +114,31 @@ class ComputerAssistant(QObject):
         self.status_topic = self.base_topic + "/status"
         self.state_topic = self.base_topic + "/state"
         self.attribute_topic = self.base_topic + "/attributes"
+        self.window_topic = self.base_topic + "/window"
+        self.idle_topic = self.base_topic + "/idle"
+        self.metrics_topic = self.base_topic + "/metrics"
+        self.memory_topic = self.base_topic + "/memory"
+        self.stream_topic = self.base_topic + "/stream"
+        self.notify_result_topic = self.base_topic + "/notify/result"
+        self.sensors_topic = self.base_topic + "/sensors"
+        self.screenshot_chunk_topic = self.screenshot_topic + "/chunk"
+        self.history_topic = self.base_topic + "/history"
         self.cmd_topic = self.base_topic + "/cmd"
         self.subscribe_topic = self.cmd_topic + "/#"
 
+        # home assistant discovery
+        self.discovery = HADiscovery(HA_DISCOVERY_PREFIX, TOPIC_APP_NAME,
+                                     CA_DISCOVERY_CACHE)
+
         # activity state
         self._state = Status.ONLINE
 
         # valid settings
         self.valid_settings = False
 
-        # set up keyboard and mouse hooks
-        keyboard.on_press(self.event_fired)
-        mouse.hook(self.event_fired)
+        # query the os for idle time, falls back to keyboard and mouse hooks
+        self.idle_source = idle_source or create_idle_source()
+        self.idle_source.start(self.event_fired)
 
     @property
     def state(self):
@@ -91,7 +153,22 @@ class ComputerAssistant(QObject):
         return self._ltu
 
     def update_last_time_used(self):
-        self._ltu = datetime.datetime.now()
+        self._ltu = self.clock()
+        if self.recorder is not None:
+            self.recorder.record_input(self._ltu.timestamp())
+
+    def poll_idle_source(self):
+        # refresh last time used from a polled idle source
+        if not self.idle_source.polled:
+            return
+        idle = self.idle_source.idle_seconds()
+        if idle is not None:
+            ltu = self.clock() - datetime.timedelta(seconds=idle)
+            # record input once, not the jitter of repeated polls
+            if self.recorder is not None and \
+                    (ltu - self._ltu).total_seconds() >= 1:
+                self.recorder.record_input(ltu.timestamp())
+            self._ltu = ltu
 
     @property
     def previous_time(self):
@@ -107,7 +184,28 @@ class ComputerAssistant(QObject):
     @freq.setter
     def freq(self, value):
         self._freq = value
-        self.timer.setInterval(value * 1000)
+        self.effective_freq = value
+
+    @property
+    def effective_freq(self):
+        # current capture interval, differs from freq when adaptive
+        return self._effective_freq
+
+    @effective_freq.setter
+    def effective_freq(self, value):
+        self._effective_freq = value
+        self.timer.setInterval(self.tick * 1000)
+
+    @property
+    def tick(self):
+        # update interval, a stretched capture interval only spaces out
+        # captures so activity and idle are still checked every freq
+        return min(self._freq, self._effective_freq)
+
+    def adapt_freq(self):
+        # stretch or shrink the capture interval using the scheduler
+        if self.scheduler is not None:
+            self.effective_freq = self.scheduler.interval(self._freq)
 
     @property
     def active_timeout(self):
@@ -117,37 +215,135 @@ class ComputerAssistant(QObject):
     def active_timeout(self, value):
         self._active_timeout = value
 
+    def update_last_capture(self):
+        self._last_capture = self.clock()
+
+    def capture_due(self):
+        if self._last_capture is None:
+            return True
+        if self.capture_policy == CapturePolicy.TICK:
+            # allow half a tick for timer jitter
+            elapsed = (self.clock() - self._last_capture).total_seconds()
+            return elapsed + self.tick / 2 >= self._effective_freq
+        return (self.clock() - self._last_capture).seconds >= \
+            self.fallback_freq
+
     def can_trigger(self):
-        return (self._ltu - self._ptu).seconds > self._freq
+        return (self._ltu - self._ptu).seconds > self.tick
 
     def is_idle(self):
-        return (datetime.datetime.now() - self._ltu).seconds >\
+        return (self.clock() - self._ltu).seconds >\
             self._active_timeout
 
     def event_fired(self, event):
-        if isinstance(event, mouse.MoveEvent):
+        # ignore mouse moves, checked by name so mouse is only imported
+        # when hooks are in use
+        if type(event).__name__ == "MoveEvent":
             return
         self.update_last_time_used()
 
-    def publish_ha_config(self):
-        # build payload for home assistant system config
-        payload = f'{{"availability_topic":"{self.status_topic}",' \
-            f'"device": {{' \
-            f'"identifiers": "{self.computer_name}",' \
-            f'"name": "{self.computer_name}"}},' \
-            f'"icon":"mdi:microsoft",' \
-            f'"json_attributes_topic":"{self.attribute_topic}",' \
-            f'"name":"{self.computer_name}",' \
-            f'"payload_available":"online",' \
-            f'"payload_not_available":"offline",' \
-            f'"qos":"1",' \
-            f'"state_topic":"{self.state_topic}",' \
-            f'"unique_id":"{self.computer_name}"}}'
-
-        # publish system config for Home Assistant
-        # NOTE: send empty payload to delete device
-        mqtt.client.publish(HA_TOPIC + self.computer_name + "/config",
-                            payload=payload, qos=0, retain=True)
+    def idle_seconds(self) -> int:
+        return (self.clock() - self._ltu).seconds
+
+    def ha_entities(self) -> list:
+        # entities configured in home assistant via mqtt discovery
+        common = {
+            "availability_topic": self.status_topic,
+            "device": {
+                "identifiers": self.computer_name,
+                "name": self.computer_name},
+            "payload_available": "online",
+            "payload_not_available": "offline",
+            "qos": 1
+        }
+        name = self.computer_name
+        if self.stream_url is None:
+            view = Entity("camera", f"{name}_screenshot", {
+                **common,
+                "name": f"{name} Active Window",
+                "topic": self.screenshot_topic,
+                "unique_id": f"{name}_screenshot"})
+        else:
+            # for the generic camera's stream source
+            view = Entity("sensor", f"{name}_stream_url", {
+                **common,
+                "icon": "mdi:video",
+                "name": f"{name} Stream URL",
+                "state_topic": self.stream_topic,
+                "unique_id": f"{name}_stream_url"})
+        return [
+            Entity("sensor", name, {
+                **common,
+                "icon": "mdi:microsoft",
+                "json_attributes_topic": self.attribute_topic,
+                "name": name,
+                "state_topic": self.state_topic,
+                "unique_id": name}),
+            view,
+            Entity("sensor", f"{name}_window", {
+                **common,
+                "icon": "mdi:application",
+                "name": f"{name} Current Window",
+                "state_topic": self.window_topic,
+                "unique_id": f"{name}_window"}),
+            Entity("sensor", f"{name}_idle", {
+                **common,
+                "icon": "mdi:timer-sand",
+                "name": f"{name} Idle",
+                "state_class": "measurement",
+                "state_topic": self.idle_topic,
+                "unique_id": f"{name}_idle",
+                "unit_of_measurement": "s"}),
+            Entity("sensor", f"{name}_capture_interval", {
+                **common,
+                "entity_category": "diagnostic",
+                "icon": "mdi:timer-cog-outline",
+                "name": f"{name} Capture Interval",
+                "state_topic": self.metrics_topic,
+                "unique_id": f"{name}_capture_interval",
+                "unit_of_measurement": "s",
+                "value_template": "{{ value_json.capture_interval }}"}),
+            Entity("sensor", f"{name}_screenshot_size", {
+                **common,
+                "entity_category": "diagnostic",
+                "icon": "mdi:file-image-outline",
+                "name": f"{name} Screenshot Size",
+                "state_topic": self.metrics_topic,
+                "unique_id": f"{name}_screenshot_size",
+                "unit_of_measurement": "B",
+                "value_template": "{{ value_json.screenshot_bytes }}"}),
+            Entity("sensor", f"{name}_memory", {
+                **common,
+                "entity_category": "diagnostic",
+                "icon": "mdi:memory",
+                "name": f"{name} Memory",
+                "state_topic": self.metrics_topic,
+                "unique_id": f"{name}_memory",
+                "unit_of_measurement": "MB",
+                "value_template": "{{ value_json.memory_rss }}"}),
+        ] + self.sensor_entities(common)
+
+    def sensor_entities(self, common: dict) -> list:
+        # an entity for each field of the enabled system sensors
+        if self.system_sensors is None:
+            return []
+        name = self.computer_name
+        return [Entity("sensor", f"{name}_{key}", {
+            **common,
+            "icon": icon,
+            "name": f"{name} {field_name}",
+            "state_class": "measurement",
+            "state_topic": self.sensors_topic,
+            "unique_id": f"{name}_{key}",
+            "unit_of_measurement": unit,
+            "value_template": f"{{{{ value_json.{key} }}}}"})
+            for key, field_name, unit, icon in self.system_sensors.fields()]
+
+    def publish_ha_config(self, force: bool = False):
+        # publish device configuration for Home Assistant, configs already
+        # retained on this broker are skipped unless forced
+        self.discovery.publish(mqtt.client, self.ha_entities(),
+                               f"{mqtt.host}:{mqtt.port}", force)
 
 
 # return active window handle
@@ -171,13 +367,21 @@ def get_window_title() -> str:
         return "Unknown"
 
 
-def screenshot() -> bytearray:
-    # grab a screenshot of the active window
+def grab_window():
+    # grab an image of the active window
     hwnd = get_active_window()
     rect = windows.get_window_rect(hwnd)
     bbox = (rect.left, rect.top, rect.right, rect.bottom)
     # Windows and OSX only (all_screens=True Windows only)
-    img = ImageGrab.grab(bbox, False, all_screens=True)
+    return ImageGrab.grab(bbox, False, all_screens=True)
+
+
+def screenshot(reduce: int = 1) -> bytearray:
+    # grab a screenshot of the active window
+    img = grab_window()
+    # lower the resolution when shedding memory
+    if reduce > 1:
+        img = img.reduce(reduce)
     return convert.to_byte_array(img)
 
 
@@ -196,8 +400,14 @@ def mqtt_connected():
     # hide reconnect menu action if visible
     tray_icon.contextMenu().actions()[0].setVisible(False)
 
+    # advertise the stream on the interface used to reach the broker
+    if stream_server is not None:
+        ca.stream_url = stream_server.url(mqtt.host)
+
     # publish device configuration to home assistant
     ca.publish_ha_config()
+    if ca.stream_url is not None:
+        mqtt.client.publish(ca.stream_topic, ca.stream_url, retain=True)
 
     # publish online status
     mqtt.client.publish(ca.status_topic, "online")
@@ -209,6 +419,10 @@ def mqtt_connected():
         tray_icon.notify("No Commands",
                          "Could not subscribe, no command function available", tray_icon.MessageIcon.Warning)
 
+    # the cache can't tell if the broker lost the retained configs, home
+    # assistant's birth message triggers a full republish
+    mqtt.client.subscribe(ca.discovery.status_topic, 1)
+
 
 @Slot()
 def mqtt_connection_error(err):
@@ -244,51 +458,276 @@ def mqtt_reconnect_failure():
                      "Cannot connect to the MQTT broker, reconnection attempts failed.\n Please check your settings and/or the status of your broker service.", tray_icon.MessageIcon.Critical)
 
 
+def publish_screenshot(reduce: int = 1) -> int:
+    # capture and publish a screenshot, returns its size, 0 on failure or
+    # None when it is sent in chunks in the background
+    started = time.perf_counter()
+    if ca.screenshot_chunk_size:
+        if ca.chunk_thread is not None and ca.chunk_thread.is_alive():
+            logger.info("screenshot skipped, previous one still sending")
+            return 0
+        img = grab_window()
+        if reduce > 1:
+            img = img.reduce(reduce)
+        ca.chunk_thread = threading.Thread(
+            target=publish_chunks, args=(img, started),
+            name="ScreenshotChunks", daemon=True)
+        ca.chunk_thread.start()
+        return None
+
+    image = screenshot(reduce)
+    if image is None:
+        return 0
+    ca.screenshot_info = mqtt.client.publish(ca.screenshot_topic, image)
+    digest = hashlib.sha1(image).digest()
+    # keep the encoded frame, chunked frames are never held whole and
+    # reduced frames are only taken while shedding memory
+    if ca.history is not None and reduce == 1:
+        ca.history.add(ca.clock().timestamp(), image, digest)
+    record_screenshot(time.perf_counter() - started, len(image),
+                      zlib.crc32(image), digest)
+    return len(image)
+
+
+def wait_for_chunk(message_info):
+    if not mqtt.wait_for_publish(message_info):
+        raise TimeoutError("screenshot chunk not sent")
+
+
+def publish_chunks(img, started: float):
+    # runs on a worker thread, streams the png into chunks so memory is
+    # bounded by the chunk size and waits for each chunk to be sent so the
+    # frame doesn't pile up in the client's queue
+    writer = ChunkWriter(
+        lambda chunk: mqtt.client.publish(ca.screenshot_chunk_topic, chunk),
+        ca.screenshot_chunk_size, wait=wait_for_chunk)
+    try:
+        with writer:
+            if not convert.to_stream(img, writer):
+                # don't complete a frame that was only partly encoded
+                writer.abort()
+    except TimeoutError:
+        # the frame is aborted rather than queue more behind a stuck chunk
+        logger.warning("screenshot chunk not sent in time, frame dropped")
+    if writer.aborted:
+        return
+    ca.chunks_published.emit((time.perf_counter() - started, writer.size,
+                              writer.crc, writer.digest, writer.result))
+
+
+@Slot(object)
+def chunks_published(result):
+    # book keeping for a chunked screenshot, on the qt thread
+    duration, size, crc, digest, ca.screenshot_info = result
+    record_screenshot(duration, size, crc, digest)
+    publish_metrics(size)
+
+
+def record_screenshot(duration: float, size: int, crc: int, digest: bytes):
+    if ca.recorder is not None:
+        ca.recorder.record_capture(ca.clock().timestamp(), duration, size,
+                                   crc)
+    if ca.scheduler is not None:
+        ca.scheduler.record_digest(digest)
+
+
+def publish_metrics(size: int):
+    mqtt.client.publish(ca.metrics_topic, json.dumps({
+        "capture_interval": ca.effective_freq,
+        "screenshot_bytes": size,
+        "memory_rss": round(memory_budget.rss_mb(), 1)}))
+
+
+def publish_active_state():
+    if ca.state != Status.ACTIVE:
+        ca.state = Status.ACTIVE
+        mqtt.client.publish(ca.state_topic, ca.state.name.title())
+
+
+def capture_update(window_title: str):
+    # publish the current window and a screenshot of it
+    current_window = json.dumps(window_title)
+
+    mqtt.client.publish(ca.attribute_topic, '{"Last Active At":"' +
+                        ca.last_time_used.strftime("%d/%m/%Y %H:%M:%S") +
+                        '","Current Window":' + current_window + '}')
+    mqtt.client.publish(ca.window_topic, window_title)
+
+    # TODO: check have valid screenshot else send screen grab error image
+
+    size = 0
+    shedding = memory_budget.over_budget()
+    if shedding and ca.history is not None:
+        logger.info("history shed %d bytes", ca.history.shed())
+    if stream_server is not None:
+        # the mjpeg stream carries the images, mqtt only carries state
+        pass
+    elif shedding and ca.screenshot_info is not None and \
+            not ca.screenshot_info.is_published():
+        # drop this screenshot rather than queue another behind it
+        logger.info("screenshot dropped, previous one still queued")
+    else:
+        size = publish_screenshot(2 if shedding else 1)
+    ca.update_last_capture()
+    # chunked screenshots publish their metrics once sent
+    if size is not None:
+        publish_metrics(size)
+
+
 def do_update():
     if mqtt.state != ConnectionStatus.CONNECTED:
         return
+    ca.poll_idle_source()
     if ca.can_trigger():
         ca.update_previous_time()
-        if ca.state != Status.ACTIVE:
-            ca.state = Status.ACTIVE
-            mqtt.client.publish(ca.state_topic, ca.state.name.title())
+        publish_active_state()
+        # with the foreground policy the tick is only a slow fallback
+        if ca.capture_due():
+            capture_update(get_window_title())
+    elif ca.state == Status.ACTIVE and ca.is_idle():
+        ca.state = Status.ONLINE
+        mqtt.client.publish(ca.state_topic, ca.state.name.title())
 
-        window_title = get_window_title()
-        current_window = json.dumps(window_title)
+    mqtt.client.publish(ca.idle_topic, ca.idle_seconds())
 
-        mqtt.client.publish(ca.attribute_topic, '{"Last Active At":"' +
-                            ca.last_time_used.strftime("%d/%m/%Y %H:%M:%S") +
-                            '","Current Window":' + current_window + '}')
+    # recalculate the capture interval for the next tick
+    ca.adapt_freq()
 
-        # TODO: check have valid screenshot else send screen grab error image
 
-        image = screenshot()
-        if image is not None:
-            mqtt.client.publish(ca.screenshot_topic, image)
-    elif ca.state == Status.ACTIVE and ca.is_idle():
-        ca.state = Status.ONLINE
-        mqtt.client.publish(ca.state_topic, ca.state.name.title())
+@Slot(str, bool)
+def window_changed(window_title, switched):
+    # capture once a foreground window or title change has settled
+    if ca.capture_policy != CapturePolicy.FOREGROUND or \
+            mqtt.state != ConnectionStatus.CONNECTED:
+        return
+    ca.poll_idle_source()
+    if ca.is_idle():
+        # a title updated by the application itself e.g. a clock isn't
+        # worth a capture while nobody is using the computer
+        if not switched:
+            return
+        # a window switch without input is captured without marking the
+        # computer active
+    else:
+        ca.update_previous_time()
+        publish_active_state()
+    capture_update(window_title)
+
+
+@Slot(str)
+def record_window(window_title):
+    # record titles when they change, not when they are captured
+    if ca.recorder is not None:
+        ca.recorder.record_window(ca.clock().timestamp(), window_title)
 
 
 def on_cmd_notify(client, userdata, msg):
-    notification = json.loads(msg.payload)
-    tray_icon.notify(
-        notification["title"], notification["message"], tray_icon.MessageIcon.Information)
+    # queued and shown on the qt thread, not the mqtt thread
+    notifications.submit(msg.payload)
+
+
+def show_notification(title, message):
+    tray_icon.notify(title, message, tray_icon.MessageIcon.Information)
 
 
-def on_cmd_screenshot(self, client, userdata):
-    mqtt.client.publish(ca.screenshot_topic, screenshot())
+def publish_notify_result(result):
+    if mqtt.state == ConnectionStatus.CONNECTED:
+        mqtt.client.publish(ca.notify_result_topic, result)
+
+
+def on_cmd_history(client, userdata, msg):
+    # publish the frame closest to a timestamp or the available timestamps
+    if ca.history is None:
+        return
+    try:
+        # a timestamp request is tiny, reject anything larger before parsing
+        if len(msg.payload) > 256:
+            raise ValueError("history request too large")
+        request = json.loads(msg.payload) if msg.payload.strip() else {}
+        requested = request.get("timestamp") if isinstance(request, dict) \
+            else None
+        if isinstance(requested, str):
+            requested = datetime.datetime.fromisoformat(requested).timestamp()
+        elif isinstance(requested, bool) or \
+                not isinstance(requested, (int, float, type(None))):
+            raise TypeError(f"timestamp of type {type(requested).__name__}")
+        frame = None if requested is None else \
+            ca.history.closest(float(requested))
+    except (ValueError, TypeError, OverflowError, RecursionError):
+        # an exception here would stop the mqtt network loop
+        logger.warning("invalid history request %r", msg.payload[:100])
+        return
+
+    if requested is None:
+        mqtt.client.publish(ca.history_topic + "/index",
+                            json.dumps({"timestamps": ca.history.timestamps()}))
+        return
+    if frame is None:
+        mqtt.client.publish(ca.history_topic + "/result",
+                            json.dumps({"requested": requested,
+                                        "timestamp": None}))
+        return
+    timestamp, image = frame
+    mqtt.client.publish(ca.history_topic + "/frame", image)
+    mqtt.client.publish(ca.history_topic + "/result",
+                        json.dumps({"requested": requested,
+                                    "timestamp": timestamp,
+                                    "bytes": len(image)}))
+
+
+def on_cmd_log_level(client, userdata, msg):
+    # change the log level without a restart e.g. payload DEBUG
+    level = msg.payload.decode(errors="replace")
+    if logs.set_level(level):
+        logger.info("log level set to %s", level.strip().upper())
+    else:
+        logger.warning("invalid log level %r", level)
+
+
+def on_cmd_discovery(client, userdata, msg):
+    # republish all discovery configs, e.g. after the broker lost them
+    ca.discovery_requested.emit()
+
+
+def on_ha_status(client, userdata, msg):
+    # home assistant (re)started, it may have missed or lost the configs
+    if msg.payload.strip().lower() != b"online":
+        return
+    logger.info("home assistant online, republishing discovery configs")
+    ca.discovery_requested.emit()
+
+
+@Slot()
+def republish_discovery():
+    # on the qt thread like every other use of the discovery cache
+    if mqtt.state != ConnectionStatus.CONNECTED:
+        return
+    ca.publish_ha_config(force=True)
+    mqtt.client.publish(ca.status_topic, "online")
+    mqtt.client.publish(ca.state_topic, ca.state.name.title())
+
+
+def on_cmd_screenshot(client, userdata, msg):
+    # captured on the qt thread, not the network thread
+    ca.screenshot_requested.emit()
+
+
+def configured_brokers() -> list:
+    # the broker from the settings dialog is preferred, mqtt_brokers are
+    # fallbacks in order of preference
+    brokers = [Broker(settings.mqtt_host, int(settings.mqtt_port))]
+    for broker in settings.mqtt_brokers:
+        brokers.append(Broker(broker["host"], int(broker.get("port", 1883))))
+    return brokers
 
 
 @Slot()
 def dialog_saved():
     # update mqtt connection details
     mqtt_changed = False
-    if mqtt.host != settings.mqtt_host:
-        mqtt.host = settings.mqtt_host
-        mqtt_changed = True
-    if mqtt.port != int(settings.mqtt_port):
-        mqtt.port = int(settings.mqtt_port)
+    brokers = configured_brokers()
+    if mqtt.brokers != brokers:
+        mqtt.brokers = brokers
         mqtt_changed = True
     if mqtt.username != settings.mqtt_username:
         mqtt.username = settings.mqtt_username
@@ -297,9 +736,29 @@ def dialog_saved():
         mqtt.password = settings.mqtt_password
         mqtt_changed = True
     mqtt.timeout = settings.mqtt_timeout
+    mqtt.probe_timeout = settings.mqtt_probe_timeout
+    mqtt.failback_interval = settings.mqtt_failback_interval
+    configure_notifications()
     # update timings
     ca.freq = settings.frequency
     ca.active_timeout = settings.active_timeout
+    ca.screenshot_chunk_size = settings.screenshot_chunk_size
+    configure_scheduler()
+    configure_capture_policy()
+    configure_history()
+    configure_memory()
+    sensors_changed = configure_sensors()
+    stream_changed = configure_stream()
+    if (sensors_changed or stream_changed) and not mqtt_changed and \
+            mqtt.state == ConnectionStatus.CONNECTED:
+        # update the stream url and discovery configs
+        if stream_server is not None:
+            ca.stream_url = stream_server.url(mqtt.host)
+            mqtt.client.publish(ca.stream_topic, ca.stream_url, retain=True)
+        elif stream_changed:
+            # clear the retained url
+            mqtt.client.publish(ca.stream_topic, "", retain=True)
+        ca.publish_ha_config()
 
     # reconnect if mqtt details changed
     if mqtt_changed:
@@ -309,6 +768,149 @@ def dialog_saved():
         ca.attempt_reconnect.emit()
 
 
+def configure_scheduler():
+    # enable or disable the adaptive capture interval from settings
+    if settings.adaptive_frequency:
+        if ca.scheduler is None:
+            ca.scheduler = AdaptiveScheduler()
+        ca.scheduler.min_interval = settings.min_frequency
+        ca.scheduler.max_interval = settings.max_frequency
+    else:
+        ca.scheduler = None
+        # restore the fixed interval
+        ca.freq = settings.frequency
+
+
+def configure_stream():
+    # start or stop the mjpeg server from settings, returns True if changed
+    global stream_server
+    if stream_server is not None:
+        if settings.stream_enabled and \
+                stream_server.port == settings.stream_port and \
+                stream_server.host == settings.stream_host and \
+                stream_server.token == (settings.stream_token or None):
+            stream_server.source.fps = settings.stream_fps
+            return False
+        stream_server.stop()
+        stream_server = None
+        ca.stream_url = None
+    if settings.stream_enabled:
+        try:
+            stream_server = MjpegServer(
+                lambda: convert.to_jpeg(grab_window(),
+                                        settings.stream_quality),
+                settings.stream_port, settings.stream_fps,
+                settings.stream_host, settings.stream_token)
+        except OSError as err:
+            tray_icon.notify("Stream Error",
+                             f"Cannot serve stream on port "
+                             f"{settings.stream_port}: {err.strerror}",
+                             tray_icon.MessageIcon.Warning)
+            return True
+        stream_server.start()
+    return True
+
+
+def configure_notifications():
+    notifications.window = settings.notify_window
+    notifications.rate = max(1, settings.notify_rate)
+    notifications.period = settings.notify_period
+    notifications.max_queued = settings.notify_max_queued
+
+
+def configure_capture_policy():
+    try:
+        ca.capture_policy = CapturePolicy[settings.capture_policy.upper()]
+    except KeyError:
+        logger.warning("invalid capture policy %r, using tick",
+                       settings.capture_policy)
+        ca.capture_policy = CapturePolicy.TICK
+        tray_icon.notify("Settings Error",
+                         f"Unknown capture policy {settings.capture_policy}, "
+                         f"capturing every tick",
+                         tray_icon.MessageIcon.Warning)
+    ca.fallback_freq = settings.fallback_frequency
+    window_watcher.poll_interval = settings.window_poll_interval
+    window_watcher.debounce = settings.window_debounce
+    # title only changes are captured no more often than this
+    window_watcher.title_interval = settings.window_title_interval * 1000
+    # also watched while recording a trace to record title changes
+    if ca.capture_policy == CapturePolicy.FOREGROUND or \
+            ca.recorder is not None:
+        if not window_watcher.active:
+            window_watcher.start()
+    else:
+        window_watcher.stop()
+
+
+def configure_sensors():
+    # enable the configured system sensors, returns True if the enabled
+    # sensors changed
+    enabled = tuple(settings.system_sensors)
+    current = ca.system_sensors.enabled if ca.system_sensors else ()
+    if enabled != current:
+        try:
+            ca.system_sensors = SystemSensors(
+                enabled, settings.sensors_disk_path) if enabled else None
+        except ValueError as err:
+            ca.system_sensors = None
+            tray_icon.notify("Settings Error", str(err).capitalize(),
+                             tray_icon.MessageIcon.Warning)
+    elif ca.system_sensors is not None and settings.sensors_disk_path:
+        ca.system_sensors.disk_path = settings.sensors_disk_path
+    if ca.system_sensors is None:
+        sensors_timer.stop()
+    else:
+        sensors_timer.start(settings.sensors_interval * 1000)
+    return enabled != current
+
+
+@Slot()
+def publish_system_sensors():
+    values = ca.system_sensors.sample()
+    if mqtt.state == ConnectionStatus.CONNECTED:
+        mqtt.client.publish(ca.sensors_topic,
+                            json.dumps(values, separators=(",", ":")))
+    # keep sampling cost bounded
+    interval = ca.system_sensors.interval(settings.sensors_interval)
+    if interval * 1000 != sensors_timer.interval():
+        logger.info("sensor interval stretched to %ds", interval)
+        sensors_timer.setInterval(interval * 1000)
+
+
+def configure_history():
+    budget = settings.history_budget_mb * 1048576
+    if not budget:
+        ca.history = None
+    elif ca.history is None:
+        ca.history = FrameHistory(budget)
+    else:
+        ca.history.resize(budget)
+
+
+def configure_memory():
+    # apply the memory budget and start or stop the leak sentinel
+    memory_budget.budget_mb = settings.memory_budget_mb
+    if settings.leak_sentinel:
+        leak_sentinel.top = settings.leak_sentinel_top
+        if not leak_sentinel.running:
+            leak_sentinel.start()
+        leak_timer.start(settings.leak_sentinel_interval * 1000)
+    elif leak_sentinel.running:
+        leak_timer.stop()
+        leak_sentinel.stop()
+
+
+@Slot()
+def check_for_leaks():
+    growth = leak_sentinel.check()
+    if growth and mqtt.state == ConnectionStatus.CONNECTED:
+        mqtt.client.publish(ca.memory_topic, json.dumps({
+            "rss": round(memory_budget.rss_mb(), 1),
+            "growth": [{"site": site, "size": size, "count": count}
+                       for site, size, count in growth]}))
+
+
 @Slot()
 def message_clicked():
     # TODO add functionality to allow user-defined action when notification clicked
@@ -330,20 +932,25 @@ def menu_item_clicked(action):
             mqtt.client.publish(ca.state_topic, ca.state.name.title())
             mqtt_message_info = mqtt.client.publish(
                 ca.status_topic, ca.state.name.lower())
-            mqtt_message_info.wait_for_publish()
+            mqtt.wait_for_publish(mqtt_message_info)
             #print(f"MQTTMessageInfo = {mqtt_message_info}")
             #print(f"Published: {mqtt_message_info.is_published()}")
 
-        mqtt.enabled = False
-        mqtt_thread.quit()
-        mqtt_thread.wait()
+        ca.idle_source.stop()
+        mqtt.stop()
+        if mqtt_thread is not None:
+            mqtt_thread.quit()
+            mqtt_thread.wait()
+        if ca.recorder is not None:
+            ca.recorder.close()
+        if stream_server is not None:
+            stream_server.stop()
+        # flush queued log records
+        log_listener.stop()
         app.exit()
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.DEBUG,
-                        format='%(asctime)s - %(levelname)s - %(message)s')
-
     # create qt application
     app = QApplication(sys.argv)
     # ensure app does not close when settings window closes
@@ -368,23 +975,70 @@ if __name__ == "__main__":
         tray_icon.notify(
             "Invalid JSON", "The settings file is not valid JSON", tray_icon.MessageIcon.Critical)
 
+    # log through a queue to a rotating file next to settings.json
+    log_listener = logs.setup_logging(settings.log_level, CA_LOG,
+                                      settings.log_max_bytes,
+                                      settings.log_backup_count,
+                                      settings.log_rate_limit,
+                                      settings.log_rate_period)
+
     # create settings dialog
     dialog = SettingsDialog(APP_NAME, CA_ICON, settings)
     dialog.accepted.connect(dialog_saved)
 
     # create an instance of the ComputerAssistant class with the computer's name
-    ca = ComputerAssistant(uname().node)
+    ca = ComputerAssistant(uname().node,
+                           create_idle_source(settings.idle_source))
     ca.freq = settings.frequency
     ca.active_timeout = settings.active_timeout
+    ca.screenshot_chunk_size = settings.screenshot_chunk_size
+    configure_scheduler()
+    if settings.record_trace:
+        ca.recorder = TraceRecorder(CA_TRACE)
+
+    # recent screenshots for the history command
+    configure_history()
+
+    # capture when the foreground window changes
+    window_watcher = WindowWatcher(get_active_window, get_window_title)
+    window_watcher.window_changed.connect(window_changed)
+    window_watcher.title_changed.connect(record_window)
+    configure_capture_policy()
+
+    # memory budget and optional tracemalloc leak sentinel
+    memory_budget = MemoryBudget()
+    leak_sentinel = LeakSentinel()
+    leak_timer = QTimer()
+    leak_timer.timeout.connect(check_for_leaks)
+    configure_memory()
+
+    # host health sensors
+    sensors_timer = QTimer()
+    sensors_timer.timeout.connect(publish_system_sensors)
+    configure_sensors()
+
+    # optional mjpeg stream of the active window
+    stream_server = None
+    configure_stream()
 
     # create and configure the mqtt client
-    mqtt = Mqtt(f"{APP_NAME}: {ca.computer_name}")
+    # the qt loop mode runs paho from the event loop rather than threads
+    if settings.mqtt_loop == "qt":
+        mqtt = QtMqtt(f"{APP_NAME}: {ca.computer_name}")
+    else:
+        mqtt = Mqtt(f"{APP_NAME}: {ca.computer_name}")
 
-    mqtt.host = settings.mqtt_host
-    mqtt.port = int(settings.mqtt_port)
+    mqtt.brokers = configured_brokers()
     mqtt.username = settings.mqtt_username
     mqtt.password = settings.mqtt_password
     mqtt.timeout = settings.mqtt_timeout
+    mqtt.probe_timeout = settings.mqtt_probe_timeout
+    mqtt.failback_interval = settings.mqtt_failback_interval
+
+    # notifications are coalesced, rate limited and acknowledged
+    notifications = NotificationQueue(show_notification,
+                                      publish_notify_result)
+    configure_notifications()
 
     # set the LWT, so if disconnected abruptly the state is set to Offline
     mqtt.client.will_set(ca.state_topic, Status.OFFLINE.name.title(),
@@ -398,22 +1052,45 @@ if __name__ == "__main__":
     mqtt.reconnecting.connect(mqtt_reconnecting)
     mqtt.reconnect_failure.connect(mqtt_reconnect_failure)
     ca.attempt_reconnect.connect(mqtt.reconnect_to_broker)
+    ca.screenshot_requested.connect(publish_screenshot, Qt.QueuedConnection)
+    ca.chunks_published.connect(chunks_published)
+    ca.discovery_requested.connect(republish_discovery, Qt.QueuedConnection)
 
     # add on message callback for screenshot command
     mqtt.client.message_callback_add(
         f'{ca.cmd_topic}/screenshot', on_cmd_screenshot)
 
+    # add on message callback for history command
+    mqtt.client.message_callback_add(
+        f'{ca.cmd_topic}/history', on_cmd_history)
+
+    # add on message callback for discovery command
+    mqtt.client.message_callback_add(
+        f'{ca.cmd_topic}/discovery', on_cmd_discovery)
+
+    # add on message callback for home assistant's birth message
+    mqtt.client.message_callback_add(ca.discovery.status_topic, on_ha_status)
+
+    # add on message callback for log level command
+    mqtt.client.message_callback_add(
+        f'{ca.cmd_topic}/log_level', on_cmd_log_level)
+
     # add on message call back for notify command
     mqtt.client.message_callback_add(f'{ca.cmd_topic}/notify', on_cmd_notify)
 
-    # create a thread for mqtt
-    mqtt_thread = QThread()
-    # connect signals to slots
-    mqtt_thread.finished.connect(mqtt.deleteLater)
-    mqtt_thread.started.connect(mqtt.connect_to_broker)
-    # move mqtt process to new thread and start
-    mqtt.moveToThread(mqtt_thread)
-    mqtt_thread.start()
+    if isinstance(mqtt, QtMqtt):
+        # driven by the qt event loop, no threads needed
+        mqtt_thread = None
+        mqtt.connect_to_broker()
+    else:
+        # create a thread for mqtt
+        mqtt_thread = QThread()
+        # connect signals to slots
+        mqtt_thread.finished.connect(mqtt.deleteLater)
+        mqtt_thread.started.connect(mqtt.connect_to_broker)
+        # move mqtt process to new thread and start
+        mqtt.moveToThread(mqtt_thread)
+        mqtt_thread.start()
 
     ca.timer.timeout.connect(do_update)
     ca.timer.start()
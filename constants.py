@@ -17,12 +17,20 @@ class Status(Enum):
     ACTIVE = 2
 
 
+# When screenshots are captured
+@unique
+class CapturePolicy(Enum):
+    TICK = 0
+    FOREGROUND = 1
+
+
 # Application Name
 APP_NAME = "Computer Assistant"
 TOPIC_APP_NAME = (APP_NAME.lower()).replace(" ", "-")
 
 # MQTT Topics
-HA_TOPIC = f"homeassistant/sensor/{TOPIC_APP_NAME}/"
+HA_DISCOVERY_PREFIX = "homeassistant"
+HA_TOPIC = f"{HA_DISCOVERY_PREFIX}/sensor/{TOPIC_APP_NAME}/"
 BASE_TOPIC = f"{TOPIC_APP_NAME}/sensor/"
 
 MQTT_TIMEOUT = 30
@@ -35,7 +43,45 @@ DEFAULT_SETTINGS = """{
                         "mqtt_password": "",
                         "frequency": 15,
                         "active_timeout": 120,
-                        "mqtt_timeout": 30
+                        "mqtt_timeout": 30,
+                        "mqtt_brokers": [],
+                        "mqtt_probe_timeout": 2,
+                        "mqtt_failback_interval": 60,
+                        "mqtt_loop": "thread",
+                        "adaptive_frequency": false,
+                        "min_frequency": 5,
+                        "max_frequency": 300,
+                        "idle_source": "auto",
+                        "memory_budget_mb": 0,
+                        "leak_sentinel": false,
+                        "leak_sentinel_interval": 600,
+                        "leak_sentinel_top": 10,
+                        "log_level": "INFO",
+                        "log_max_bytes": 1048576,
+                        "log_backup_count": 3,
+                        "log_rate_limit": 10,
+                        "log_rate_period": 60,
+                        "record_trace": false,
+                        "stream_enabled": false,
+                        "stream_port": 8765,
+                        "stream_host": "",
+                        "stream_token": "",
+                        "stream_fps": 2,
+                        "stream_quality": 75,
+                        "notify_window": 2,
+                        "notify_rate": 5,
+                        "notify_period": 60,
+                        "notify_max_queued": 50,
+                        "capture_policy": "tick",
+                        "fallback_frequency": 300,
+                        "window_poll_interval": 250,
+                        "window_debounce": 500,
+                        "window_title_interval": 60,
+                        "system_sensors": [],
+                        "sensors_interval": 30,
+                        "sensors_disk_path": "",
+                        "screenshot_chunk_size": 0,
+                        "history_budget_mb": 0
                       }"""
 
 # RESOURCES
@@ -58,3 +104,9 @@ CA_TIMER_ICON = f"{RESOURCE_BASE_PATH}/images/timer_64x64.png"
 # FILES
 # Settings file
 CA_SETTINGS = f"{SETTINGS_PATH}/settings.json"
+# Hashes of published home assistant discovery configs
+CA_DISCOVERY_CACHE = f"{SETTINGS_PATH}/discovery.json"
+# Log file, rotated when it reaches log_max_bytes
+CA_LOG = f"{SETTINGS_PATH}/computer-assistant.log"
+# Trace of input, window and capture events for replay.py
+CA_TRACE = f"{SETTINGS_PATH}/trace.bin"
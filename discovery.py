@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# discovery.py
+# written by Malcolm Dixon 2020
+# classes for publishing home assistant mqtt discovery configs
+
+import hashlib
+import json
+import logging
+from collections import namedtuple
+
+
+logger = logging.getLogger(__name__)
+
+# an entity to configure in home assistant, component is the discovery
+# component e.g. sensor or camera, config is the entity specific config
+Entity = namedtuple("Entity", ["component", "object_id", "config"])
+
+
+class HADiscovery:
+    '''Publishes discovery configs, skipping those already retained'''
+
+    def __init__(self, prefix: str, node_id: str, cache_file: str):
+        self.prefix = prefix
+        self.node_id = node_id
+        self._cache_file = cache_file
+        # published config hashes by topic for each broker
+        self._cache = {}
+        self.load_cache()
+
+    def load_cache(self):
+        try:
+            with open(self._cache_file) as cache_file:
+                self._cache = json.load(cache_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # no cache, everything will be published
+            pass
+
+    def save_cache(self):
+        with open(self._cache_file, "w") as cache_file:
+            json.dump(self._cache, cache_file)
+
+    @property
+    def status_topic(self) -> str:
+        # home assistant publishes its birth message "online" here on start
+        return f"{self.prefix}/status"
+
+    def topic(self, entity: Entity) -> str:
+        return f"{self.prefix}/{entity.component}/{self.node_id}/" \
+            f"{entity.object_id}/config"
+
+    @staticmethod
+    def payload(entity: Entity) -> str:
+        # serialize consistently so the hash only changes with the config
+        return json.dumps(entity.config, sort_keys=True,
+                          separators=(",", ":"))
+
+    def publish(self, client, entities: list, broker: str,
+                force: bool = False) -> int:
+        # publish changed configs in one batch, returns number published
+        # each broker retains its own configs
+        configs = self._cache.setdefault(broker, {})
+        if force:
+            configs.clear()
+
+        published = 0
+        current = set()
+        for entity in entities:
+            topic = self.topic(entity)
+            payload = self.payload(entity)
+            digest = hashlib.sha1(payload.encode()).hexdigest()
+            current.add(topic)
+            if configs.get(topic) == digest:
+                continue
+            result = client.publish(topic, payload, qos=1, retain=True)
+            if result.rc == 0:
+                configs[topic] = digest
+                published += 1
+
+        # remove entities that are no longer configured
+        for topic in set(configs) - current:
+            # NOTE: an empty retained payload deletes the entity
+            result = client.publish(topic, "", qos=1, retain=True)
+            if result.rc == 0:
+                del configs[topic]
+                published += 1
+
+        if published:
+            self.save_cache()
+        logger.debug("published %d of %d discovery configs",
+                     published, len(entities))
+        return published
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# eventtrace.py
+# written by Malcolm Dixon 2020
+# compact binary trace of input, window and capture events for replay
+
+import struct
+from collections import namedtuple
+from enum import IntEnum, unique
+
+
+# file header, the last byte is the format version
+MAGIC = b"CATRACE\x01"
+
+# every record starts with its type and a unix timestamp
+RECORD_HEADER = struct.Struct("<Bd")
+# window records are followed by the utf-8 title length and the title
+WINDOW_LENGTH = struct.Struct("<H")
+# capture records are followed by duration (s), size and crc32 of the image
+CAPTURE = struct.Struct("<fII")
+
+
+@unique
+class RecordType(IntEnum):
+    '''Trace record types'''
+    INPUT = 0
+    WINDOW = 1
+    CAPTURE = 2
+
+
+# a decoded record, value is None for input, the title for window and
+# a (duration, size, crc) tuple for capture records
+TraceRecord = namedtuple("TraceRecord", ["type", "timestamp", "value"])
+
+
+class TraceRecorder:
+    '''Appends trace records to a file'''
+
+    def __init__(self, filename: str):
+        self._file = open(filename, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._title = None
+
+    def record_input(self, timestamp: float):
+        self._file.write(RECORD_HEADER.pack(RecordType.INPUT, timestamp))
+
+    def record_window(self, timestamp: float, title: str):
+        # only title changes are recorded
+        if title == self._title:
+            return
+        self._title = title
+        data = title.encode("utf-8")[:0xFFFF]
+        self._file.write(RECORD_HEADER.pack(RecordType.WINDOW, timestamp) +
+                         WINDOW_LENGTH.pack(len(data)) + data)
+
+    def record_capture(self, timestamp: float, duration: float, size: int,
+                       crc: int):
+        self._file.write(RECORD_HEADER.pack(RecordType.CAPTURE, timestamp) +
+                         CAPTURE.pack(duration, size, crc))
+
+    def close(self):
+        self._file.close()
+
+
+def read_trace(filename: str):
+    # generator of TraceRecords from a trace file
+    with open(filename, "rb") as trace_file:
+        if trace_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filename} is not a trace file")
+        while True:
+            header = trace_file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                # end of file or a record truncated by a crash
+                return
+            record_type, timestamp = RECORD_HEADER.unpack(header)
+            if record_type == RecordType.INPUT:
+                value = None
+            elif record_type == RecordType.WINDOW:
+                length = trace_file.read(WINDOW_LENGTH.size)
+                if len(length) < WINDOW_LENGTH.size:
+                    return
+                data = trace_file.read(WINDOW_LENGTH.unpack(length)[0])
+                value = data.decode("utf-8", errors="replace")
+            elif record_type == RecordType.CAPTURE:
+                data = trace_file.read(CAPTURE.size)
+                if len(data) < CAPTURE.size:
+                    return
+                value = CAPTURE.unpack(data)
+            else:
+                raise ValueError(f"unknown record type {record_type}")
+            yield TraceRecord(RecordType(record_type), timestamp, value)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# history.py
+# written by Malcolm Dixon 2020
+# class to keep recent screenshots within a memory budget
+
+import bisect
+import hashlib
+import threading
+from collections import deque
+
+
+# bytes accounted for each entry on top of the image data so repeats of
+# an unchanged image are also bounded
+ENTRY_OVERHEAD = 64
+
+
+class FrameHistory:
+    '''Ring of recent encoded frames, oldest dropped to stay within budget
+
+    Identical frames are stored once however many times they were taken.
+    '''
+
+    def __init__(self, budget: int):
+        # budget in bytes
+        self.budget = budget
+        self.size = 0
+        # (timestamp, digest) oldest first
+        self._entries = deque()
+        # digest -> [image, no. of entries using it]
+        self._images = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, timestamp: float, image: bytes, digest: bytes = None):
+        if digest is None:
+            digest = hashlib.sha1(image).digest()
+        with self._lock:
+            stored = self._images.get(digest)
+            if stored is None:
+                self._images[digest] = [image, 1]
+                self.size += len(image)
+            else:
+                stored[1] += 1
+            self._entries.append((timestamp, digest))
+            self.size += ENTRY_OVERHEAD
+            self._trim()
+
+    def _trim(self, limit: int = None):
+        # drop the oldest entries until within budget or limit bytes
+        limit = self.budget if limit is None else limit
+        while self._entries and self.size > limit:
+            _, digest = self._entries.popleft()
+            self.size -= ENTRY_OVERHEAD
+            stored = self._images[digest]
+            stored[1] -= 1
+            if not stored[1]:
+                del self._images[digest]
+                self.size -= len(stored[0])
+
+    def resize(self, budget: int):
+        with self._lock:
+            self.budget = budget
+            self._trim()
+
+    def shed(self) -> int:
+        # drop the oldest half of the memory used, e.g. while over a memory
+        # budget, without changing the budget, returns bytes freed
+        with self._lock:
+            size = self.size
+            self._trim(size // 2)
+            return size - self.size
+
+    def timestamps(self) -> list:
+        with self._lock:
+            return [timestamp for timestamp, _ in self._entries]
+
+    def closest(self, timestamp: float):
+        # return (timestamp, image) of the frame nearest to timestamp
+        with self._lock:
+            if not self._entries:
+                return None
+            times = [entry[0] for entry in self._entries]
+            index = bisect.bisect_left(times, timestamp)
+            # compare with the frame before the insertion point
+            if index == len(times) or (index > 0 and timestamp - times[index - 1]
+                                       <= times[index] - timestamp):
+                index -= 1
+            found, digest = self._entries[index]
+            return found, self._images[digest][0]
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# idle.py
+# written by Malcolm Dixon 2020
+# classes to determine how long the computer has been idle
+
+import logging
+from psutil import WINDOWS, LINUX
+
+
+logger = logging.getLogger(__name__)
+
+
+class IdleSource:
+    '''Base class for a source of user input activity
+
+    Polled sources are queried with idle_seconds() when needed, event
+    sources call the callback passed to start() for every input event.
+    '''
+    polled = True
+
+    def start(self, callback):
+        pass
+
+    def stop(self):
+        pass
+
+    def idle_seconds(self) -> float:
+        # return seconds since last input or None if unknown
+        return None
+
+
+class HookIdleSource(IdleSource):
+    '''Global keyboard and mouse hooks, runs a callback per input event'''
+    polled = False
+
+    def __init__(self):
+        self._hooks = []
+
+    def start(self, callback):
+        # import here as installing hooks needs root on Linux
+        import keyboard
+        import mouse
+        self._hooks.append((keyboard, keyboard.on_press(callback)))
+        self._hooks.append((mouse, mouse.hook(callback)))
+
+    def stop(self):
+        for module, hook in self._hooks:
+            module.unhook(hook)
+        self._hooks.clear()
+
+
+class WindowsIdleSource(IdleSource):
+    '''Idle time from GetLastInputInfo'''
+
+    def __init__(self):
+        from microsoft import windows
+        self._windows = windows
+
+    def idle_seconds(self) -> float:
+        return self._windows.get_idle_time() / 1000
+
+
+class X11IdleSource(IdleSource):
+    '''Idle time from the X11 MIT-SCREEN-SAVER extension'''
+
+    def __init__(self, display_name: str = None):
+        from linux import x11
+        self._query = x11.IdleQuery(display_name)
+
+    def idle_seconds(self) -> float:
+        return self._query.idle_time() / 1000
+
+    def stop(self):
+        self._query.close()
+
+
+def create_idle_source(kind: str = "auto") -> IdleSource:
+    # kind is "os", "hooks" or "auto" to prefer the os with hooks fallback
+    if kind != "hooks":
+        try:
+            if WINDOWS:
+                return WindowsIdleSource()
+            if LINUX:
+                return X11IdleSource()
+        except OSError as err:
+            logger.warning("OS idle time unavailable: %s", err)
+            if kind == "os":
+                raise
+    return HookIdleSource()
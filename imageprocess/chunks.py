@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# chunks.py
+# written by Malcolm Dixon 2020
+# classes to split an encoded image into fixed size chunks as it is
+# written and to reassemble the chunks
+
+import hashlib
+import io
+import struct
+import time
+import zlib
+
+
+# every chunk starts with frame id, sequence no. and total chunks, total is
+# 0 except on the last chunk of a frame where it is sequence no. + 1
+CHUNK_HEADER = struct.Struct("!III")
+
+
+class ChunkWriter(io.RawIOBase):
+    '''Writable stream that passes fixed size chunks to a sink
+
+    One chunk is held back so the last chunk can be marked with the total
+    when the stream is closed. When wait is given it is called with the
+    previous sink result before each chunk is passed on, so with a sink
+    that queues, e.g. mqtt publish, about two chunks are in memory at once.
+    A frame that is aborted never gets its last chunk so is never complete.
+    '''
+
+    def __init__(self, sink, chunk_size: int, frame_id: int = None,
+                 wait=None):
+        super().__init__()
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.frame_id = frame_id if frame_id is not None else \
+            int(time.time() * 1000) & 0xFFFFFFFF
+        self.wait = wait
+        self.aborted = False
+        # result of the last sink call e.g. MQTTMessageInfo
+        self.result = None
+        self.size = 0
+        self.crc = 0
+        self._sha1 = hashlib.sha1()
+        self._buffer = bytearray()
+        self._sequence = 0
+
+    @property
+    def digest(self) -> bytes:
+        return self._sha1.digest()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.size += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        self._sha1.update(data)
+        self._buffer += data
+        # hold back a full chunk in case it is the last one
+        while len(self._buffer) > self.chunk_size:
+            self._emit(self._buffer[:self.chunk_size], 0)
+            del self._buffer[:self.chunk_size]
+        return len(data)
+
+    def _emit(self, data, total: int):
+        # let the previous chunk go before queuing another
+        if self.wait is not None and self.result is not None:
+            self.wait(self.result)
+        header = CHUNK_HEADER.pack(self.frame_id, self._sequence, total)
+        self.result = self.sink(header + data)
+        self._sequence += 1
+
+    def abort(self):
+        # drop the rest of the frame, e.g. when encoding failed
+        self.aborted = True
+        self._buffer.clear()
+        self.close()
+
+    def close(self):
+        # send the last chunk marked with the total
+        if not self.closed and self.size and not self.aborted:
+            self._emit(bytes(self._buffer), self._sequence + 1)
+            self._buffer.clear()
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+class ChunkAssembler:
+    '''Reassembles chunks from ChunkWriter into complete frames
+
+    Only the most recent max_frames incomplete frames are kept.
+    '''
+
+    def __init__(self, max_frames: int = 2):
+        self.max_frames = max_frames
+        # frame id -> [chunks by sequence no., total]
+        self._frames = {}
+
+    def add(self, payload: bytes) -> bytes:
+        # add a chunk, returns the frame once all its chunks have arrived
+        frame_id, sequence, total = CHUNK_HEADER.unpack_from(payload)
+        frame = self._frames.get(frame_id)
+        if frame is None:
+            frame = self._frames[frame_id] = [{}, 0]
+            # discard the oldest incomplete frames
+            while len(self._frames) > self.max_frames:
+                del self._frames[next(iter(self._frames))]
+        frame[0][sequence] = payload[CHUNK_HEADER.size:]
+        if total:
+            frame[1] = total
+        chunks, total = frame
+        if not total or len(chunks) < total:
+            return None
+        del self._frames[frame_id]
+        return b"".join(chunks[index] for index in range(total))
@@ -2,16 +2,35 @@
 
 # convert.py
 # written by Malcolm Dixon 2020
-# function to convert image to byte array
+# functions to convert an image to a byte array
 
 from io import BytesIO
 from PIL import Image
 
 
 def to_byte_array(image: Image) -> bytearray:
+    image_byte_array: bytearray = BytesIO()
+    if not to_stream(image, image_byte_array):
+        return None
+    return image_byte_array.getvalue()
+
+
+def to_stream(image: Image, stream) -> bool:
+    # encode as png into a writable stream, e.g. a ChunkWriter
+    try:
+        image.save(stream, "PNG")
+    except SystemError:
+        return False
+    except AttributeError:
+        return False
+    return True
+
+
+def to_jpeg(image: Image, quality: int = 75) -> bytes:
     image_byte_array: bytearray = BytesIO()
     try:
-        image.save(image_byte_array, "PNG")
+        # jpeg has no alpha channel
+        image.convert("RGB").save(image_byte_array, "JPEG", quality=quality)
     except SystemError:
         return None
     except AttributeError:
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# x11.py
+# written by Malcolm Dixon 2020
+# functions for working with the X11 display server
+
+from ctypes import (Structure, POINTER, byref, cdll, c_ulong, c_int,
+                    c_void_p, c_char_p)
+from ctypes.util import find_library
+
+
+class XScreenSaverInfo(Structure):
+    _fields_ = [("window", c_ulong),
+                ("state", c_int),
+                ("kind", c_int),
+                ("til_or_since", c_ulong),
+                ("idle", c_ulong),
+                ("eventMask", c_ulong)]
+
+
+class IdleQuery:
+    '''Queries the X server for milliseconds since the last input event'''
+
+    def __init__(self, display_name: str = None):
+        xlib_name = find_library("X11")
+        xss_name = find_library("Xss")
+        if xlib_name is None or xss_name is None:
+            raise OSError("libX11 or libXss not found")
+        self._xlib = cdll.LoadLibrary(xlib_name)
+        self._xss = cdll.LoadLibrary(xss_name)
+
+        self._xlib.XOpenDisplay.argtypes = [c_char_p]
+        self._xlib.XOpenDisplay.restype = c_void_p
+        self._xlib.XDefaultRootWindow.argtypes = [c_void_p]
+        self._xlib.XDefaultRootWindow.restype = c_ulong
+        self._xlib.XCloseDisplay.argtypes = [c_void_p]
+        self._xlib.XFree.argtypes = [c_void_p]
+        self._xss.XScreenSaverQueryExtension.argtypes = [
+            c_void_p, POINTER(c_int), POINTER(c_int)]
+        self._xss.XScreenSaverAllocInfo.restype = POINTER(XScreenSaverInfo)
+        self._xss.XScreenSaverQueryInfo.argtypes = [
+            c_void_p, c_ulong, POINTER(XScreenSaverInfo)]
+
+        name = display_name.encode() if display_name else None
+        self._display = self._xlib.XOpenDisplay(name)
+        if not self._display:
+            raise OSError("cannot open X display")
+
+        event_base, error_base = c_int(), c_int()
+        if not self._xss.XScreenSaverQueryExtension(
+                self._display, byref(event_base), byref(error_base)):
+            self.close()
+            raise OSError("X server has no MIT-SCREEN-SAVER extension")
+
+        self._root = self._xlib.XDefaultRootWindow(self._display)
+        self._info = self._xss.XScreenSaverAllocInfo()
+
+    def idle_time(self) -> int:
+        # return milliseconds since last keyboard or mouse input
+        self._xss.XScreenSaverQueryInfo(self._display, self._root, self._info)
+        return self._info.contents.idle
+
+    def close(self):
+        if getattr(self, "_info", None):
+            self._xlib.XFree(self._info)
+            self._info = None
+        if self._display:
+            self._xlib.XCloseDisplay(self._display)
+            self._display = None
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# logs.py
+# written by Malcolm Dixon 2020
+# non-blocking logging, records are formatted and written on a listener
+# thread so logging never blocks the qt or mqtt threads
+
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+LOG_FORMAT = '%(asctime)s - %(threadName)s - %(name)s - %(levelname)s - ' \
+    '%(message)s'
+
+
+class RateLimitFilter(logging.Filter):
+    '''Allows at most burst records per message key within a period
+
+    The key is the logger name, level and unformatted message so repeated
+    messages with different arguments are counted together. Keys are
+    dropped once their period has ended, report is called with a record
+    counting the suppressed messages of a key that didn't log again.
+    '''
+
+    def __init__(self, burst: int = 10, period: float = 60.0, report=None):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.report = report
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._next_prune = time.monotonic() + period
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            start, count, suppressed = self._keys.get(key, (now, 0, 0))
+            if now - start >= self.period:
+                # new period, report how many were suppressed in the last
+                if suppressed:
+                    record.msg = f"{record.msg} " \
+                        f"[{suppressed} similar messages suppressed]"
+                start, count, suppressed = now, 0, 0
+            count += 1
+            allowed = count <= self.burst
+            if not allowed:
+                suppressed += 1
+            self._keys[key] = (start, count, suppressed)
+            expired = self._prune(now) if now >= self._next_prune else []
+        # outside the lock as the report is filtered too
+        for key, suppressed in expired:
+            self._report(key, suppressed)
+        return allowed
+
+    def _prune(self, now: float) -> list:
+        # drop keys whose period has ended, returns (key, suppressed) for
+        # those that suppressed messages
+        self._next_prune = now + self.period
+        expired = [(key, suppressed)
+                   for key, (start, _, suppressed) in self._keys.items()
+                   if now - start >= self.period]
+        for key, _ in expired:
+            del self._keys[key]
+        return [(key, suppressed) for key, suppressed in expired
+                if suppressed]
+
+    def _report(self, key: tuple, suppressed: int):
+        if self.report is None:
+            return
+        name, levelno, msg = key
+        self.report(logging.LogRecord(
+            name, levelno, __file__, 0,
+            "%d similar messages suppressed: %s", (suppressed, msg), None))
+
+
+def setup_logging(level: str, log_file: str, max_bytes: int = 1048576,
+                  backup_count: int = 3, burst: int = 10,
+                  period: float = 60.0) -> QueueListener:
+    # route all logging through a queue to a rotating file and the console,
+    # the returned listener must be stopped on exit to flush the queue
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    # rate limit before records are queued so a storm costs little
+    queue_handler.addFilter(RateLimitFilter(burst, period,
+                                            queue_handler.handle))
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                       backupCount=backup_count,
+                                       encoding="utf-8")
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+    set_level(level)
+
+    listener = QueueListener(log_queue, file_handler, console_handler,
+                             respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def set_level(level: str) -> bool:
+    # set the root logger level by name, returns False if not a level
+    level = str(level).strip().upper()
+    if not isinstance(logging.getLevelName(level), int):
+        return False
+    logging.getLogger().setLevel(level)
+    return True
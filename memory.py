@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# memory.py
+# written by Malcolm Dixon 2020
+# classes to keep the memory use of the long running agent in check
+
+import logging
+import tracemalloc
+import psutil
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    '''Reports when the resident set size exceeds a budget'''
+
+    def __init__(self, budget_mb: int = 0):
+        # a budget of 0 disables the check
+        self.budget_mb = budget_mb
+        self._process = psutil.Process()
+
+    def rss_mb(self) -> float:
+        return self._process.memory_info().rss / 1048576
+
+    def over_budget(self) -> bool:
+        if not self.budget_mb:
+            return False
+        rss = self.rss_mb()
+        if rss > self.budget_mb:
+            logger.info("memory %.1f MB over budget of %d MB, shedding",
+                        rss, self.budget_mb)
+            return True
+        return False
+
+
+class LeakSentinel:
+    '''Periodically compares tracemalloc snapshots to find growth'''
+
+    def __init__(self, top: int = 10, frames: int = 1):
+        self.top = top
+        self._frames = frames
+        self._previous = None
+        # True if start() started tracing, e.g. not PYTHONTRACEMALLOC
+        self._started = False
+        # ignore allocations made by the tracing machinery itself
+        self._filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>")
+        ]
+
+    @property
+    def running(self) -> bool:
+        return self._previous is not None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames)
+            self._started = True
+        self._previous = self._snapshot()
+
+    def stop(self):
+        self._previous = None
+        # leave tracing started by something else running
+        if self._started:
+            self._started = False
+            tracemalloc.stop()
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self._filters)
+
+    def check(self) -> list:
+        # log and return the allocation sites that grew the most since the
+        # last check as a list of (site, size diff, count diff)
+        if self._previous is None:
+            return []
+        snapshot = self._snapshot()
+        stats = snapshot.compare_to(self._previous, "lineno")
+        self._previous = snapshot
+
+        growth = []
+        for stat in stats[:self.top]:
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            site = f"{frame.filename}:{frame.lineno}"
+            growth.append((site, stat.size_diff, stat.count_diff))
+            logger.warning("memory growth %+d B (%+d blocks) at %s",
+                           stat.size_diff, stat.count_diff, site)
+        return growth
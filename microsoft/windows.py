@@ -4,7 +4,8 @@
 # written by Malcolm Dixon 2020
 # functions for working with MS Windows windows
 
-from ctypes import windll, wintypes, create_unicode_buffer, byref
+from ctypes import (windll, wintypes, create_unicode_buffer, byref,
+                    sizeof, Structure)
 
 
 def active_window() -> int:
@@ -25,3 +26,18 @@ def get_window_rect(hwnd: int) -> wintypes.RECT:
     rect = wintypes.RECT()
     windll.user32.GetWindowRect(hwnd, byref(rect))
     return rect
+
+
+class LASTINPUTINFO(Structure):
+    _fields_ = [("cbSize", wintypes.UINT),
+                ("dwTime", wintypes.DWORD)]
+
+
+def get_idle_time() -> int:
+    # return milliseconds since last keyboard or mouse input
+    info = LASTINPUTINFO()
+    info.cbSize = sizeof(info)
+    if not windll.user32.GetLastInputInfo(byref(info)):
+        return 0
+    # tick counts are 32 bit and wrap after ~49.7 days
+    return (windll.kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF
@@ -4,14 +4,25 @@
 # written by Malcolm Dixon 2020
 # classes for working with paho mqtt library
 
+import logging
+import socket
 import sys
+import threading
 import time
+from collections import deque, namedtuple
 from enum import Enum, IntEnum, unique
 import paho.mqtt.client as mqtt
-from PySide2.QtCore import Signal, Slot, QObject
+from PySide2.QtCore import (
+    Signal, Slot, QObject, QTimer, QThread, QSocketNotifier)
 from helpers import enum_name_to_str, camel_case_to_sent_case
 
 
+logger = logging.getLogger(__name__)
+
+# a broker endpoint
+Broker = namedtuple("Broker", ["host", "port"])
+
+
 @unique
 class ConnectionStatus(Enum):
     '''Mqtt connection status'''
@@ -57,6 +68,19 @@ class Mqtt(QObject):
         self.timeout = 30
         self.reconnect_attempts = 0
         self.max_reconnect_attempts = 2
+        # ordered broker endpoints, the first is preferred
+        self._brokers = []
+        # seconds to wait for a broker to accept a tcp connection
+        self.probe_timeout = 2
+        # seconds between checks to move back to the preferred broker
+        self.failback_interval = 60
+        # keep paho's own reconnection attempts to a few seconds apart
+        self.client.reconnect_delay_set(1, 5)
+        # notified when a message is sent or the connection is lost, paho
+        # calls on_publish before marking the message info as published so
+        # the ids of recently sent messages are kept
+        self._published = threading.Condition()
+        self._sent = deque(maxlen=100)
         # connect callbacks
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
@@ -64,6 +88,54 @@ class Mqtt(QObject):
         self.client.on_subscribe = self.on_subscribe
         self.client.on_disconnect = self.on_disconnect
 
+    @property
+    def brokers(self) -> list:
+        return self._brokers
+
+    @brokers.setter
+    def brokers(self, value: list):
+        self._brokers = list(value)
+        if self._brokers:
+            self.host, self.port = self._brokers[0]
+
+    @property
+    def broker(self) -> Broker:
+        # the broker currently in use
+        return Broker(self.host, self.port)
+
+    def probe(self, broker: Broker) -> float:
+        # return seconds taken to open a tcp connection or None if down
+        started = time.perf_counter()
+        try:
+            with socket.create_connection(broker, self.probe_timeout):
+                return time.perf_counter() - started
+        except OSError:
+            return None
+
+    def select_broker(self) -> Broker:
+        # the preferred broker if healthy else the fastest healthy broker
+        if not self._brokers:
+            return self.broker
+        latencies = []
+        for priority, broker in enumerate(self._brokers):
+            latency = self.probe(broker)
+            logger.debug("broker %s:%d latency %s", *broker, latency)
+            if latency is None:
+                continue
+            if priority == 0:
+                return broker
+            latencies.append((latency, priority, broker))
+        if not latencies:
+            # none healthy, let the connection attempt report the error
+            return self._brokers[0]
+        return min(latencies)[2]
+
+    def preferred_recovered(self) -> bool:
+        # True if using a fallback broker and the preferred is healthy again
+        return len(self._brokers) > 1 and \
+            self.broker != self._brokers[0] and \
+            self.probe(self._brokers[0]) is not None
+
     @Slot()
     def connect_to_broker(self):
         # connect to the MQTT broker
@@ -73,6 +145,7 @@ class Mqtt(QObject):
             if self.reconnect_attempts > 0:
                 self.reconnecting.emit(self.reconnect_attempts)
             try:
+                self.host, self.port = self.select_broker()
                 self.client.loop_start()
                 self.state = ConnectionStatus.CONNECTING
                 self.connecting.emit()
@@ -88,8 +161,18 @@ class Mqtt(QObject):
                         raise TimeoutError
 
                 # loop until connection state changes to not connected
+                waiting = 0
                 while self.enabled and self.state == ConnectionStatus.CONNECTED:
                     time.sleep(1)
+                    waiting += 1
+                    if self.failback_interval and \
+                            waiting % self.failback_interval == 0 and \
+                            self.preferred_recovered():
+                        logger.info("moving back to preferred broker %s:%d",
+                                    *self._brokers[0])
+                        self.disconnect_from_broker()
+                        # the loop thread ends on disconnect, restart it
+                        self.client.loop_stop()
 
             except Exception:
                 self.state = ConnectionStatus.CONNECTION_ERROR
@@ -107,7 +190,9 @@ class Mqtt(QObject):
                 # if connection still enabled then check if can reconnect
                 if self.enabled:
                     self.reconnect_attempts += 1
-                    if self.reconnect_attempts > self.max_reconnect_attempts:
+                    # allow the attempts for each broker
+                    if self.reconnect_attempts > self.max_reconnect_attempts *\
+                            max(1, len(self._brokers)):
                         self.reconnect_failure.emit()
                         # disable connection due to too many errors
                         self.enabled = False
@@ -134,6 +219,22 @@ class Mqtt(QObject):
         # reconnect
         self.connect_to_broker()
 
+    def wait_for_publish(self, message_info, timeout: float = 5) -> bool:
+        # block until a message is sent by the loop, returns True if sent
+        def sent():
+            return message_info.mid in self._sent or \
+                message_info.is_published()
+
+        with self._published:
+            self._published.wait_for(
+                lambda: sent() or not self.client.is_connected(), timeout)
+            return sent()
+
+    @Slot()
+    def stop(self):
+        # stop connecting, the connection loop disconnects and returns
+        self.enabled = False
+
     @Slot()
     def publish(self):
         # check rc, check for ValueError to ensure valid publish
@@ -167,15 +268,256 @@ class Mqtt(QObject):
         # rc != 0 is an unexpected disconnection
         self.state = ConnectionStatus.DISCONNECTED
         self.disconnected.emit(rc)
+        # wake anything waiting for a message that won't be sent
+        with self._published:
+            self._published.notify_all()
 
     def on_message(self, client, userdata, msg):
         pass
 
     def on_publish(self, client, userdata, result):
-        pass
+        # result is the message id
+        with self._published:
+            self._sent.append(result)
+            self._published.notify_all()
 
     def on_subscribe(self, client, userdata, mid, granted_qos):
         pass
 
     def __del__(self):
         self.client.disconnect()
+
+
+class QtMqtt(Mqtt):
+    '''Mqtt driven from the qt event loop instead of extra threads
+
+    paho's socket is registered with QSocketNotifiers which call
+    loop_read/loop_write when the socket is ready and a timer calls
+    loop_misc for keep alives, so all callbacks run on the qt thread.
+    Broker probes and the blocking dns lookup and tcp connect run on a
+    short lived worker thread and report back with queued signals.
+    '''
+
+    # results from the worker thread, delivered on the qt thread
+    _connect_finished = Signal(str, bool)
+    _failback_checked = Signal(bool)
+    # paho socket callbacks, may be called from the worker thread
+    _socket_opened = Signal(object)
+    _socket_closed = Signal()
+    _write_wanted = Signal(bool)
+
+    def __init__(self, client_id="", clean=True):
+        super().__init__(client_id, clean)
+        self._read_notifier = None
+        self._write_notifier = None
+        self._worker = None
+        # keep alive and timeout handling
+        self._misc_timer = QTimer(self)
+        self._misc_timer.setInterval(1000)
+        self._misc_timer.timeout.connect(self._loop_misc)
+        # schedules connection attempts
+        self._connect_timer = QTimer(self)
+        self._connect_timer.setSingleShot(True)
+        self._connect_timer.timeout.connect(self._attempt_connection)
+        # connection attempt timeout
+        self._timeout_timer = QTimer(self)
+        self._timeout_timer.setSingleShot(True)
+        self._timeout_timer.timeout.connect(self._connection_timed_out)
+        # checks if the preferred broker has recovered
+        self._failback_timer = QTimer(self)
+        self._failback_timer.timeout.connect(self._check_failback)
+        # socket callbacks used instead of paho's loop thread
+        self.client.on_socket_open = self._socket_open
+        self.client.on_socket_close = self._socket_close
+        self.client.on_socket_register_write = self._register_write
+        self.client.on_socket_unregister_write = self._unregister_write
+        self._connect_finished.connect(self._connection_done)
+        self._failback_checked.connect(self._failback_done)
+        self._socket_opened.connect(self._add_notifiers)
+        self._socket_closed.connect(self._remove_notifiers)
+        self._write_wanted.connect(self._enable_write)
+
+    @Slot()
+    def connect_to_broker(self):
+        self.reconnect_attempts = 0
+        self.enabled = True
+        self._misc_timer.start()
+        self._connect_timer.start(0)
+
+    @Slot()
+    def reconnect_to_broker(self):
+        self.state = ConnectionStatus.RECONNECTING
+        self.disconnect_from_broker()
+        self.connect_to_broker()
+
+    @Slot()
+    def stop(self):
+        self.enabled = False
+        self._connect_timer.stop()
+        self._timeout_timer.stop()
+        self._failback_timer.stop()
+        self.disconnect_from_broker()
+        # send the disconnect now, the event loop may not run again
+        self.client.loop_write()
+        self._misc_timer.stop()
+
+    def wait_for_publish(self, message_info, timeout: float = 5) -> bool:
+        # other threads are woken by the qt loop sending the message
+        if QThread.currentThread() != self.thread():
+            return super().wait_for_publish(message_info, timeout)
+        # on the qt thread nothing else runs the loop, so run it here
+        start = time.monotonic()
+        while not message_info.is_published() and self.client.is_connected() \
+                and time.monotonic() - start < timeout:
+            self.client.loop(0.1)
+        return message_info.is_published()
+
+    def _busy(self) -> bool:
+        return self._worker is not None and self._worker.is_alive()
+
+    def _run_worker(self, target):
+        self._worker = threading.Thread(target=target, daemon=True)
+        self._worker.start()
+
+    @Slot()
+    def _attempt_connection(self):
+        if not self.enabled or self._busy():
+            return
+        # signal the reconnect attempt no. if applicable
+        if self.reconnect_attempts > 0:
+            self.reconnecting.emit(self.reconnect_attempts)
+        self.state = ConnectionStatus.CONNECTING
+        self.connecting.emit()
+        self.client.username_pw_set(self.username, self.password)
+        self._run_worker(self._connect_worker)
+
+    def _connect_worker(self):
+        # runs on the worker thread, probes and connect block
+        try:
+            self.host, self.port = self.select_broker()
+            self.client.connect(self.host, self.port)
+        except Exception as err:
+            # network errors are retried, e.g. on another broker
+            self._connect_finished.emit(
+                camel_case_to_sent_case(type(err).__name__),
+                isinstance(err, OSError))
+            return
+        self._connect_finished.emit("", True)
+
+    @Slot(str, bool)
+    def _connection_done(self, error: str, retry: bool):
+        if error:
+            self._connection_failed(error, retry)
+        elif not self.enabled:
+            # stopped while connecting
+            self.client.disconnect()
+        else:
+            # wait for the connack
+            self._timeout_timer.start(self.timeout * 1000)
+
+    def _connection_failed(self, error: str, retry: bool):
+        self.state = ConnectionStatus.CONNECTION_ERROR
+        self.connection_error.emit(error)
+        if not retry:
+            self.enabled = False
+        self._schedule_retry()
+
+    def _schedule_retry(self):
+        if not self.enabled or self._connect_timer.isActive():
+            return
+        self.reconnect_attempts += 1
+        # allow the attempts for each broker
+        if self.reconnect_attempts > self.max_reconnect_attempts * \
+                max(1, len(self._brokers)):
+            self.reconnect_failure.emit()
+            # disable connection due to too many errors
+            self.enabled = False
+            return
+        self._connect_timer.start(1000)
+
+    @Slot()
+    def _connection_timed_out(self):
+        if self.state == ConnectionStatus.CONNECTING:
+            self.client.disconnect()
+            self._connection_failed("Timeout Error", True)
+
+    @Slot()
+    def _check_failback(self):
+        if self.state == ConnectionStatus.CONNECTED and not self._busy():
+            self._run_worker(
+                lambda: self._failback_checked.emit(
+                    self.preferred_recovered()))
+
+    @Slot(bool)
+    def _failback_done(self, recovered: bool):
+        if recovered and self.state == ConnectionStatus.CONNECTED:
+            logger.info("moving back to preferred broker %s:%d",
+                        *self._brokers[0])
+            # reconnects to the preferred broker once disconnected
+            self.disconnect_from_broker()
+
+    def on_connect(self, client, userdata, flags, rc):
+        self._timeout_timer.stop()
+        super().on_connect(client, userdata, flags, rc)
+        if self.state == ConnectionStatus.CONNECTED and self.failback_interval:
+            self._failback_timer.start(self.failback_interval * 1000)
+
+    def on_disconnect(self, client, userdata, rc):
+        self._failback_timer.stop()
+        super().on_disconnect(client, userdata, rc)
+        # fail over or reconnect
+        self._schedule_retry()
+
+    # paho calls these from whichever thread runs connect, the signals
+    # queue them to the qt thread that owns the notifiers
+    def _socket_open(self, client, userdata, sock):
+        self._socket_opened.emit(sock)
+
+    def _socket_close(self, client, userdata, sock):
+        self._socket_closed.emit()
+
+    def _register_write(self, client, userdata, sock):
+        self._write_wanted.emit(True)
+
+    def _unregister_write(self, client, userdata, sock):
+        self._write_wanted.emit(False)
+
+    @Slot(object)
+    def _add_notifiers(self, sock):
+        self._remove_notifiers()
+        self._read_notifier = QSocketNotifier(
+            sock.fileno(), QSocketNotifier.Read, self)
+        self._read_notifier.activated.connect(self._loop_read)
+        self._write_notifier = QSocketNotifier(
+            sock.fileno(), QSocketNotifier.Write, self)
+        # the connect packet may have been queued before the notifier existed
+        self._write_notifier.setEnabled(self.client.want_write())
+        self._write_notifier.activated.connect(self._loop_write)
+
+    @Slot()
+    def _remove_notifiers(self):
+        for notifier in (self._read_notifier, self._write_notifier):
+            if notifier is not None:
+                notifier.setEnabled(False)
+                notifier.deleteLater()
+        self._read_notifier = None
+        self._write_notifier = None
+
+    @Slot(bool)
+    def _enable_write(self, enabled: bool):
+        if self._write_notifier is not None:
+            self._write_notifier.setEnabled(enabled)
+
+    @Slot()
+    def _loop_read(self, *args):
+        self.client.loop_read()
+
+    @Slot()
+    def _loop_write(self, *args):
+        self.client.loop_write()
+
+    @Slot()
+    def _loop_misc(self):
+        # the client belongs to the worker while it connects
+        if self.state != ConnectionStatus.CONNECTING or not self._busy():
+            self.client.loop_misc()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# notifications.py
+# written by Malcolm Dixon 2020
+# class to queue, coalesce and rate limit notifications from mqtt
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from PySide2.QtCore import QObject, QTimer, Signal, Slot
+
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationQueue(QObject):
+    '''Queues notifications from any thread and shows them on the qt thread
+
+    Notifications with the same title arriving within window seconds are
+    shown as one, at most rate are shown every period seconds and at most
+    max_queued titles wait to be shown. Each one is acknowledged once, when
+    it is shown or rejected, by calling publish_result with a json result.
+    '''
+
+    pending = Signal()
+
+    def __init__(self, notify, publish_result, window: float = 2.0,
+                 rate: int = 5, period: float = 60.0, max_queued: int = 50,
+                 max_payload: int = 4096):
+        super().__init__()
+        self.notify = notify
+        self.publish_result = publish_result
+        self.window = window
+        # at least one notification has to be shown per period
+        self.rate = max(1, rate)
+        self.period = period
+        self.max_queued = max_queued
+        self.max_payload = max_payload
+        # title -> [last message, count, all messages the same, ids] waiting
+        # to be shown, at most max_queued titles and ids per title
+        self._groups = OrderedDict()
+        self._lock = threading.Lock()
+        # times notifications were shown within the last period
+        self._shown = deque()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        # queued connection as submit is called from the mqtt thread
+        self.pending.connect(self._schedule)
+
+    def _result(self, status: str, notification_id=None, reason=None):
+        result = {"id": notification_id, "status": status}
+        if reason is not None:
+            result["reason"] = reason
+        self.publish_result(json.dumps(result))
+
+    def _parse(self, payload: bytes):
+        # return (title, message, id) or raise ValueError with the reason,
+        # cheap checks first so junk is rejected before parsing
+        if len(payload) > self.max_payload:
+            raise ValueError("payload too large")
+        if not payload.lstrip().startswith(b"{"):
+            raise ValueError("payload is not a json object")
+        try:
+            notification = json.loads(payload)
+        except (json.JSONDecodeError, UnicodeDecodeError) as err:
+            raise ValueError("invalid json") from err
+        except RecursionError as err:
+            # deeply nested arrays or objects, e.g. [[[[...]]]]
+            raise ValueError("json nested too deeply") from err
+        if not isinstance(notification, dict):
+            raise ValueError("payload is not a json object")
+        title = notification.get("title")
+        message = notification.get("message")
+        if not isinstance(title, str) or not isinstance(message, str):
+            raise ValueError("title and message must be strings")
+        return title, message, notification.get("id")
+
+    def submit(self, payload: bytes):
+        # queue a notification payload, safe to call from any thread
+        try:
+            title, message, notification_id = self._parse(payload)
+        except ValueError as err:
+            logger.warning("notification rejected: %s", err)
+            self._result("rejected", reason=str(err))
+            return
+        with self._lock:
+            group = self._groups.get(title)
+            full = group is None and len(self._groups) >= self.max_queued
+            if group is None and not full:
+                group = self._groups[title] = [message, 0, True, []]
+            if group is not None:
+                group[2] = group[2] and message == group[0]
+                group[0] = message
+                group[1] += 1
+                # beyond max_queued ids are acknowledged straight away
+                tracked = len(group[3]) < self.max_queued
+                if tracked:
+                    group[3].append(notification_id)
+        if full:
+            self._result("dropped", notification_id, "queue full")
+            return
+        if not tracked:
+            # it will be shown as part of the group
+            self._result("coalesced", notification_id)
+        self.pending.emit()
+
+    @Slot()
+    def _schedule(self):
+        # wait for the window so notifications arriving together coalesce
+        if not self._timer.isActive():
+            self._timer.start(int(self.window * 1000))
+
+    @Slot()
+    def flush(self):
+        now = time.monotonic()
+        while self._shown and now - self._shown[0] >= self.period:
+            self._shown.popleft()
+
+        deliveries = []
+        with self._lock:
+            while self._groups and len(self._shown) < self.rate:
+                self._shown.append(now)
+                deliveries.append(self._groups.popitem(last=False))
+            remaining = bool(self._groups)
+
+        for title, (message, count, same, ids) in deliveries:
+            if count > 1:
+                message = f"{message} (x{count})" if same else \
+                    f"{count} new messages"
+            self.notify(title, message)
+            status = "delivered" if count == 1 else "coalesced"
+            for notification_id in ids:
+                self._result(status, notification_id)
+
+        if remaining:
+            # rate limited, try again once the oldest falls out of period
+            delay = self.period - (now - self._shown[0])
+            self._timer.start(max(int(delay * 1000), 1))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+# replay.py
+# written by Malcolm Dixon 2020
+# replays a recorded trace through ComputerAssistant and do_update using a
+# virtual clock and a fake publisher, no hooks, display or broker needed
+#
+# usage: python replay.py trace.bin [--frequency 15] [--adaptive [--cpu 50]
+#        [--battery]] [--profile]
+
+import argparse
+import cProfile
+import datetime
+import pstats
+import sys
+import time
+from collections import Counter
+from PySide2.QtCore import QCoreApplication
+
+import ca as agent
+from eventtrace import RecordType, read_trace
+from idle import IdleSource
+from memory import MemoryBudget
+from scheduler import AdaptiveScheduler
+from mqtt import ConnectionStatus
+
+
+class VirtualClock:
+    '''A clock that only moves when told to'''
+
+    def __init__(self, timestamp: float = 0.0):
+        self.timestamp = timestamp
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.timestamp)
+
+    def set(self, timestamp: float):
+        # never move backwards, e.g. after a capture advanced the clock
+        self.timestamp = max(self.timestamp, timestamp)
+
+    def advance(self, seconds: float):
+        self.timestamp += seconds
+
+
+class FakeMessageInfo:
+    rc = 0
+
+    @staticmethod
+    def is_published() -> bool:
+        return True
+
+    def wait_for_publish(self):
+        pass
+
+
+class FakeClient:
+    '''Counts publishes by topic instead of sending them'''
+
+    def __init__(self):
+        self.messages = Counter()
+        self.bytes = Counter()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.messages[topic] += 1
+        if payload is not None:
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            elif not isinstance(payload, (bytes, bytearray)):
+                payload = str(payload).encode("utf-8")
+            self.bytes[topic] += len(payload)
+        return FakeMessageInfo()
+
+
+class FakeMqtt:
+    def __init__(self):
+        self.state = ConnectionStatus.CONNECTED
+        self.client = FakeClient()
+        self.host = "replay"
+        self.port = 0
+
+
+class ReplayIdleSource(IdleSource):
+    '''Input is fed to event_fired by the replayer'''
+    polled = False
+
+
+class ReplayScheduler(AdaptiveScheduler):
+    '''Fixed cpu load and power state so replays are repeatable'''
+
+    def __init__(self, cpu: float = 0.0, battery: bool = False):
+        super().__init__()
+        self.cpu = cpu
+        self.battery = battery
+
+    def cpu_percent(self) -> float:
+        return self.cpu
+
+    def on_battery(self) -> bool:
+        return self.battery
+
+
+class Replayer:
+    '''Feeds trace records into ComputerAssistant and do_update'''
+
+    def __init__(self, records, frequency: int = 15,
+                 active_timeout: int = 120, adaptive: bool = False,
+                 cpu: float = 0.0, battery: bool = False):
+        self.records = sorted(records, key=lambda record: record.timestamp)
+        self.frequency = frequency
+        self.active_timeout = active_timeout
+        self.adaptive = adaptive
+        # the adaptive interval's inputs, not read from this machine
+        self.cpu = cpu
+        self.battery = battery
+        self.clock = VirtualClock()
+        self.mqtt = FakeMqtt()
+        self.ticks = 0
+        self.captures = 0
+        self._title = ""
+        self._capture = None
+
+    def _get_window_title(self) -> str:
+        return self._title
+
+    def _screenshot(self, reduce: int = 1) -> bytes:
+        # reproduce the recorded capture's cost, size and content hash
+        if self._capture is None:
+            return None
+        duration, size, crc = self._capture
+        self.clock.advance(duration)
+        self.captures += 1
+        size = max(4, size // (reduce * reduce))
+        return crc.to_bytes(4, "little") + bytes(size - 4)
+
+    def _tick(self, timestamp: float) -> float:
+        self.clock.set(timestamp)
+        agent.do_update()
+        self.ticks += 1
+        return timestamp + agent.ca.tick
+
+    def run(self) -> dict:
+        if not self.records:
+            return self.summary(0.0, 0.0)
+
+        # install the replay doubles in place of the real dependencies
+        patched = ("ca", "mqtt", "memory_budget", "stream_server",
+                   "get_window_title", "screenshot")
+        saved = {name: getattr(agent, name, None) for name in patched}
+        start = self.records[0].timestamp
+        self.clock.timestamp = start
+        assistant = agent.ComputerAssistant(
+            "replay", ReplayIdleSource(), self.clock.now)
+        assistant.freq = self.frequency
+        assistant.active_timeout = self.active_timeout
+        if self.adaptive:
+            assistant.scheduler = ReplayScheduler(self.cpu, self.battery)
+        agent.ca = assistant
+        agent.mqtt = self.mqtt
+        agent.memory_budget = MemoryBudget()
+        agent.stream_server = None
+        agent.get_window_title = self._get_window_title
+        agent.screenshot = self._screenshot
+        # screenshots before the first capture record look like the first
+        self._capture = next((record.value for record in self.records
+                              if record.type == RecordType.CAPTURE), None)
+
+        wall = time.perf_counter()
+        try:
+            next_tick = start + assistant.tick
+            for record in self.records:
+                while record.timestamp >= next_tick:
+                    next_tick = self._tick(next_tick)
+                self.clock.set(record.timestamp)
+                if record.type == RecordType.INPUT:
+                    assistant.event_fired(record)
+                elif record.type == RecordType.WINDOW:
+                    self._title = record.value
+                else:
+                    self._capture = record.value
+            # run on until the idle timeout would have been reached
+            end = self.records[-1].timestamp + self.active_timeout + \
+                assistant.tick
+            while next_tick <= end:
+                next_tick = self._tick(next_tick)
+        finally:
+            for name, value in saved.items():
+                setattr(agent, name, value)
+        wall = time.perf_counter() - wall
+        return self.summary(self.clock.timestamp - start, wall)
+
+    def summary(self, virtual: float, wall: float) -> dict:
+        client = self.mqtt.client
+        return {
+            "virtual_seconds": round(virtual, 1),
+            "wall_seconds": round(wall, 3),
+            "speedup": round(virtual / wall) if wall else None,
+            "ticks": self.ticks,
+            "captures": self.captures,
+            "messages": sum(client.messages.values()),
+            "bytes": sum(client.bytes.values()),
+            "topics": {topic: {"messages": count,
+                               "bytes": client.bytes[topic]}
+                       for topic, count in client.messages.most_common()}
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded trace")
+    parser.add_argument("trace", help="trace file recorded by ca.py")
+    parser.add_argument("--frequency", type=int, default=15)
+    parser.add_argument("--active-timeout", type=int, default=120)
+    parser.add_argument("--adaptive", action="store_true",
+                        help="use the adaptive capture interval")
+    parser.add_argument("--cpu", type=float, default=0.0,
+                        help="cpu %% seen by the adaptive interval")
+    parser.add_argument("--battery", action="store_true",
+                        help="adapt as if running on battery")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the replay with cProfile")
+    args = parser.parse_args()
+
+    # qt objects need an application instance but no event loop
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+
+    replayer = Replayer(read_trace(args.trace), args.frequency,
+                        args.active_timeout, args.adaptive, args.cpu,
+                        args.battery)
+    if args.profile:
+        profiler = cProfile.Profile()
+        summary = profiler.runcall(replayer.run)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    else:
+        summary = replayer.run()
+
+    for key, value in summary.items():
+        if key != "topics":
+            print(f"{key}: {value}")
+    for topic, counts in summary["topics"].items():
+        print(f"  {topic}: {counts['messages']} messages, "
+              f"{counts['bytes']} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# scheduler.py
+# written by Malcolm Dixon 2020
+# class to adapt the capture interval to cpu load, power state and how
+# often the active window content changes
+
+from collections import deque
+import psutil
+
+
+class AdaptiveScheduler:
+    '''Calculates the capture interval within configured bounds'''
+
+    def __init__(self, min_interval=5, max_interval=300, history=10):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # cpu % above which captures are stretched out
+        self.cpu_threshold = 75.0
+        # multiplier applied when running on battery
+        self.battery_factor = 2.0
+        # digests of the most recent screenshots, used for the change rate
+        self._digests = deque(maxlen=history)
+        self._changes = deque(maxlen=history)
+        # prime psutil so the first non-blocking cpu reading is meaningful
+        psutil.cpu_percent(interval=None)
+
+    def record_digest(self, digest: bytes):
+        # note whether a screenshot's hash differs from the last one
+        if self._digests:
+            self._changes.append(digest != self._digests[-1])
+        self._digests.append(digest)
+
+    @property
+    def change_rate(self) -> float:
+        # fraction of recent screenshots that differed from the previous one
+        # or None before two screenshots, e.g. while streaming instead
+        if not self._changes:
+            return None
+        return sum(self._changes) / len(self._changes)
+
+    @staticmethod
+    def cpu_percent() -> float:
+        # system cpu % since the last call
+        return psutil.cpu_percent(interval=None)
+
+    @staticmethod
+    def on_battery() -> bool:
+        # sensors_battery is not available on every platform
+        try:
+            battery = psutil.sensors_battery()
+        except (AttributeError, NotImplementedError):
+            return False
+        return battery is not None and not battery.power_plugged
+
+    def factor(self, cpu: float, battery: bool, change_rate: float) -> float:
+        factor = 1.0
+        # busy machine: stretch up to 4x as cpu approaches 100%
+        if cpu > self.cpu_threshold:
+            factor *= 1 + 3 * (cpu - self.cpu_threshold) / \
+                (100 - self.cpu_threshold)
+        if battery:
+            factor *= self.battery_factor
+        # static content stretches up to 2x, constantly changing halves,
+        # no effect until the change rate is known
+        if change_rate is not None:
+            factor *= 2 - 1.5 * change_rate
+        return factor
+
+    def interval(self, base: int) -> int:
+        # return the adapted interval in seconds for a base frequency
+        factor = self.factor(self.cpu_percent(), self.on_battery(),
+                             self.change_rate)
+        value = round(base * factor)
+        return max(self.min_interval, min(self.max_interval, value))
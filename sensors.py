@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# sensors.py
+# written by Malcolm Dixon 2020
+# class to sample host health (cpu, memory, disk, network) with psutil
+
+import os
+import time
+import psutil
+
+
+# fields published by each sensor as (key, name, unit, icon)
+SENSOR_FIELDS = {
+    "cpu": [("cpu", "CPU", "%", "mdi:cpu-64-bit")],
+    "memory": [("mem", "Memory Used", "%", "mdi:memory")],
+    "disk": [("disk", "Disk Used", "%", "mdi:harddisk"),
+             ("disk_read", "Disk Read", "B/s", "mdi:harddisk"),
+             ("disk_write", "Disk Write", "B/s", "mdi:harddisk")],
+    "network": [("net_rx", "Network Received", "B/s", "mdi:download-network"),
+                ("net_tx", "Network Sent", "B/s", "mdi:upload-network")],
+    "process": [("proc_cpu", "Agent CPU", "%", "mdi:cpu-64-bit"),
+                ("proc_rss", "Agent Memory", "MB", "mdi:memory")]
+}
+
+
+class SystemSensors:
+    '''Samples the enabled sensors in one batch and computes rates
+
+    The cost of each sample is measured, interval() stretches the sampling
+    interval so sampling stays below max_overhead of the time.
+    '''
+
+    def __init__(self, enabled=tuple(SENSOR_FIELDS), disk_path: str = None,
+                 max_overhead: float = 0.01):
+        unknown = set(enabled) - set(SENSOR_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown sensors: {', '.join(sorted(unknown))}")
+        self.enabled = tuple(enabled)
+        self.disk_path = disk_path or os.path.abspath(os.sep)
+        self.max_overhead = max_overhead
+        # seconds taken by the last sample
+        self.cost = 0.0
+        self._process = psutil.Process()
+        self._previous = {}
+        self._previous_time = None
+
+    def fields(self) -> list:
+        return [field for sensor in self.enabled
+                for field in SENSOR_FIELDS[sensor]]
+
+    def _rate(self, key: str, value: int, elapsed: float) -> float:
+        # bytes per second since the last sample, None on the first
+        previous = self._previous.get(key)
+        self._previous[key] = value
+        if previous is None or not elapsed:
+            return None
+        return round(max(0, value - previous) / elapsed)
+
+    def sample(self) -> dict:
+        started = time.perf_counter()
+        now = time.monotonic()
+        elapsed = now - self._previous_time if self._previous_time else None
+        self._previous_time = now
+        values = {}
+
+        if "cpu" in self.enabled:
+            # from cpu_times deltas so other cpu_percent callers don't
+            # reset our measurement interval
+            times = psutil.cpu_times()
+            # guest time is already counted in user time on linux
+            total = sum(times) - getattr(times, "guest", 0) - \
+                getattr(times, "guest_nice", 0)
+            idle = times.idle + getattr(times, "iowait", 0)
+            previous = self._previous.get("cpu_times")
+            self._previous["cpu_times"] = (total, idle)
+            if previous is not None and total > previous[0]:
+                busy = 1 - (idle - previous[1]) / (total - previous[0])
+                values["cpu"] = round(100 * busy, 1)
+
+        if "memory" in self.enabled:
+            values["mem"] = psutil.virtual_memory().percent
+
+        if "disk" in self.enabled:
+            values["disk"] = psutil.disk_usage(self.disk_path).percent
+            counters = psutil.disk_io_counters()
+            if counters is not None:
+                values["disk_read"] = self._rate(
+                    "disk_read", counters.read_bytes, elapsed)
+                values["disk_write"] = self._rate(
+                    "disk_write", counters.write_bytes, elapsed)
+
+        if "network" in self.enabled:
+            counters = psutil.net_io_counters()
+            values["net_rx"] = self._rate(
+                "net_rx", counters.bytes_recv, elapsed)
+            values["net_tx"] = self._rate(
+                "net_tx", counters.bytes_sent, elapsed)
+
+        if "process" in self.enabled:
+            # oneshot caches the process info shared by these calls
+            with self._process.oneshot():
+                proc_cpu = self._process.cpu_percent()
+                # the first call only starts the measurement and returns 0
+                values["proc_cpu"] = proc_cpu if elapsed is not None \
+                    else None
+                values["proc_rss"] = round(
+                    self._process.memory_info().rss / 1048576, 1)
+
+        self.cost = time.perf_counter() - started
+        values["sample_ms"] = round(self.cost * 1000, 2)
+        # rates and cpu % are unknown on the first sample
+        return {key: value for key, value in values.items()
+                if value is not None}
+
+    def interval(self, base: int) -> int:
+        # the base interval, stretched if sampling is too expensive
+        return max(base, round(self.cost / self.max_overhead))
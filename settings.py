@@ -181,7 +181,10 @@ class JSONSettings:
 
     def load(self):
         try:
-            self._dict = json.load(open(self._settings_file))
+            # start from defaults so new settings exist in older files
+            self._dict = json.loads(self._defaults)
+            with open(self._settings_file) as settings_file:
+                self._dict.update(json.load(settings_file))
             self.add_items()
         except FileNotFoundError:
             # create settings from defaults
@@ -202,7 +205,8 @@ class JSONSettings:
             # update setting values in dictionary from attribute values
             for key in self._dict.keys():
                 self._dict[key] = getattr(self, key)
-            json.dump(self._dict, open(self._settings_file, 'w'))
+            with open(self._settings_file, 'w') as settings_file:
+                json.dump(self._dict, settings_file)
 
     @property
     def loaded(self):
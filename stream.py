@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+# stream.py
+# written by Malcolm Dixon 2020
+# lightweight http server streaming the active window as mjpeg
+
+import hmac
+import logging
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = "frame"
+STREAM_PATH = "/stream.mjpg"
+SNAPSHOT_PATH = "/snapshot.jpg"
+
+
+class FrameSource:
+    '''Captures frames only while clients are connected
+
+    A single capture thread encodes each frame once and all clients share
+    it, capture is a callable returning jpeg bytes or None.
+    '''
+
+    def __init__(self, capture, fps: float = 2.0):
+        self.capture = capture
+        self.fps = fps
+        self._condition = threading.Condition()
+        self._clients = 0
+        self._frame = None
+        self._sequence = 0
+        self._thread = None
+
+    @property
+    def clients(self) -> int:
+        return self._clients
+
+    def add_client(self):
+        with self._condition:
+            self._clients += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="MjpegCapture", daemon=True)
+                self._thread.start()
+
+    def remove_client(self):
+        with self._condition:
+            self._clients -= 1
+
+    def wait_frame(self, sequence: int, timeout: float = 5.0):
+        # block until a frame newer than sequence, returns (sequence, frame)
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._sequence > sequence and self._frame is not None,
+                timeout)
+            return self._sequence, self._frame
+
+    def _run(self):
+        logger.debug("mjpeg capture started")
+        while True:
+            with self._condition:
+                if self._clients <= 0:
+                    # last client gone, stop capturing
+                    self._thread = None
+                    self._frame = None
+                    self._condition.notify_all()
+                    break
+            started = time.monotonic()
+            try:
+                frame = self.capture()
+            except Exception:
+                logger.exception("mjpeg capture failed")
+                frame = None
+            if frame is not None:
+                with self._condition:
+                    self._frame = frame
+                    self._sequence += 1
+                    self._condition.notify_all()
+            elapsed = time.monotonic() - started
+            time.sleep(max(0.0, 1 / self.fps - elapsed))
+        logger.debug("mjpeg capture stopped")
+
+
+class MjpegRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        source = self.server.source
+        url = urlsplit(self.path)
+        if not self._authorised(url.query):
+            self.send_error(403)
+        elif url.path == STREAM_PATH:
+            self._stream(source)
+        elif url.path == SNAPSHOT_PATH:
+            self._snapshot(source)
+        else:
+            self.send_error(404)
+
+    def _authorised(self, query: str) -> bool:
+        # when a token is set it must be given as ?token=
+        token = self.server.token
+        if not token:
+            return True
+        given = parse_qs(query).get("token", [""])[0]
+        return hmac.compare_digest(given.encode(), token.encode())
+
+    def _client_gone(self) -> bool:
+        # a closed connection reads as end of file, nothing else is sent
+        # by a client while it is streaming
+        try:
+            readable = select.select([self.connection], [], [], 0)[0]
+            return bool(readable) and \
+                not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def _stream(self, source: FrameSource):
+        self.send_response(200)
+        self.send_header("Cache-Control", "no-cache, private")
+        self.send_header("Pragma", "no-cache")
+        self.send_header("Content-Type",
+                         f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.end_headers()
+        source.add_client()
+        try:
+            sequence = 0
+            while not self.server.stopping:
+                latest, frame = source.wait_frame(sequence)
+                if latest == sequence or frame is None:
+                    # timed out waiting, nothing new to send so check the
+                    # client is still there or the capture would run on
+                    if self._client_gone():
+                        break
+                    continue
+                sequence = latest
+                self.wfile.write(
+                    f"--{BOUNDARY}\r\n"
+                    f"Content-Type: image/jpeg\r\n"
+                    f"Content-Length: {len(frame)}\r\n\r\n".encode("ascii"))
+                self.wfile.write(frame)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # client went away
+            pass
+        finally:
+            source.remove_client()
+
+    def _snapshot(self, source: FrameSource):
+        source.add_client()
+        try:
+            frame = source.wait_frame(0)[1]
+        finally:
+            source.remove_client()
+        if frame is None:
+            self.send_error(503)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(frame)))
+        self.end_headers()
+        self.wfile.write(frame)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class MjpegServer:
+    '''Serves the frame source over http on a background thread
+
+    host "" listens on all interfaces, when token is set clients must
+    pass it as ?token= in the url.
+    '''
+
+    def __init__(self, capture, port: int, fps: float = 2.0, host: str = "",
+                 token: str = None):
+        self.source = FrameSource(capture, fps)
+        self.host = host
+        self._server = ThreadingHTTPServer((host, port), MjpegRequestHandler)
+        self._server.daemon_threads = True
+        self._server.source = self.source
+        self._server.token = token or None
+        self._server.stopping = False
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def token(self) -> str:
+        return self._server.token
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="MjpegServer", daemon=True)
+        self._thread.start()
+        logger.info("mjpeg stream serving on port %d", self.port)
+
+    def stop(self):
+        self._server.stopping = True
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def url(self, remote_host: str = None) -> str:
+        address = self.host or local_address(remote_host)
+        query = f"?token={quote(self.token)}" if self.token else ""
+        return f"http://{address}:{self.port}{STREAM_PATH}{query}"
+
+
+def local_address(remote_host: str = None) -> str:
+    # address of the interface used to reach remote_host e.g. the broker,
+    # no packets are sent when connecting a udp socket
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect((remote_host or "8.8.8.8", 80))
+            return sock.getsockname()[0]
+    except OSError:
+        return socket.gethostname()
@@ -0,0 +1,8 @@
+# conftest.py
+# the modules live at the top of the repository and import each other by
+# name, e.g. from history import FrameHistory
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,85 @@
+import zlib
+
+import pytest
+
+from imageprocess.chunks import CHUNK_HEADER, ChunkAssembler, ChunkWriter
+
+
+def write_frame(data: bytes, chunk_size: int, frame_id: int = 1) -> list:
+    chunks = []
+    with ChunkWriter(chunks.append, chunk_size, frame_id) as writer:
+        writer.write(data)
+    return chunks
+
+
+@pytest.mark.parametrize("size", [1, 4, 5, 16, 17])
+def test_round_trip(size):
+    data = bytes(range(size))
+    assembler = ChunkAssembler()
+    results = [assembler.add(chunk) for chunk in write_frame(data, 4)]
+    assert results[-1] == data
+    assert all(result is None for result in results[:-1])
+
+
+def test_only_last_chunk_has_total():
+    chunks = write_frame(b"x" * 10, 4)
+    headers = [CHUNK_HEADER.unpack_from(chunk) for chunk in chunks]
+    assert [seq for _, seq, _ in headers] == [0, 1, 2]
+    assert [total for _, _, total in headers] == [0, 0, 3]
+
+
+def test_writer_totals():
+    data = b"some encoded image"
+    chunks = []
+    with ChunkWriter(chunks.append, 4, 1) as writer:
+        writer.write(data[:5])
+        writer.write(data[5:])
+    assert writer.size == len(data)
+    assert writer.crc == zlib.crc32(data)
+
+
+def test_empty_frame_sends_nothing():
+    assert write_frame(b"", 4) == []
+
+
+def test_chunks_arrive_out_of_order():
+    data = bytes(range(10))
+    assembler = ChunkAssembler()
+    chunks = write_frame(data, 4)
+    assert assembler.add(chunks[2]) is None
+    assert assembler.add(chunks[0]) is None
+    assert assembler.add(chunks[1]) == data
+
+
+def test_abort_never_completes_frame():
+    chunks = []
+    with pytest.raises(RuntimeError):
+        with ChunkWriter(chunks.append, 4, 1) as writer:
+            writer.write(bytes(10))
+            raise RuntimeError
+    assert writer.aborted
+    assembler = ChunkAssembler()
+    assert all(assembler.add(chunk) is None for chunk in chunks)
+    assert all(CHUNK_HEADER.unpack_from(chunk)[2] == 0 for chunk in chunks)
+
+
+def test_wait_called_with_previous_result():
+    waited = []
+    results = iter(range(100))
+    with ChunkWriter(lambda chunk: next(results), 4, 1,
+                     wait=waited.append) as writer:
+        writer.write(bytes(10))
+    # three chunks, each waits for the one before
+    assert waited == [0, 1]
+    assert writer.result == 2
+
+
+def test_assembler_discards_oldest_incomplete_frame():
+    assembler = ChunkAssembler(max_frames=2)
+    frames = {frame_id: write_frame(bytes([frame_id]) * 8, 4, frame_id)
+              for frame_id in (1, 2, 3)}
+    for frame_id in (1, 2, 3):
+        assembler.add(frames[frame_id][0])
+    # frame 1 was dropped when frame 3 arrived
+    assert assembler.add(frames[1][1]) is None
+    assert assembler.add(frames[3][1]) == bytes([3]) * 8
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from discovery import Entity, HADiscovery
+
+
+class FakeResult:
+    def __init__(self, rc):
+        self.rc = rc
+
+
+class FakeClient:
+    def __init__(self, rc=0):
+        self.rc = rc
+        self.published = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published.append((topic, payload, qos, retain))
+        return FakeResult(self.rc)
+
+
+@pytest.fixture
+def discovery(tmp_path):
+    return HADiscovery("homeassistant", "node", tmp_path / "discovery.json")
+
+
+def entities(state_topic="state"):
+    return [Entity("sensor", "pc", {"name": "pc", "state_topic": state_topic}),
+            Entity("camera", "pc_screenshot", {"topic": "screenshot"})]
+
+
+def test_topic_and_payload(discovery):
+    entity = Entity("sensor", "pc", {"b": 1, "a": 2})
+    assert discovery.topic(entity) == "homeassistant/sensor/node/pc/config"
+    assert discovery.payload(entity) == '{"a":2,"b":1}'
+    assert discovery.status_topic == "homeassistant/status"
+
+
+def test_unchanged_configs_skipped(discovery):
+    client = FakeClient()
+    assert discovery.publish(client, entities(), "broker:1883") == 2
+    assert all(qos == 1 and retain for _, _, qos, retain in client.published)
+    assert discovery.publish(client, entities(), "broker:1883") == 0
+    # only the changed entity is sent again
+    assert discovery.publish(client, entities("other"), "broker:1883") == 1
+    assert client.published[-1][0] == "homeassistant/sensor/node/pc/config"
+
+
+def test_force_republishes(discovery):
+    client = FakeClient()
+    discovery.publish(client, entities(), "broker:1883")
+    assert discovery.publish(client, entities(), "broker:1883", True) == 2
+
+
+def test_each_broker_cached_separately(discovery):
+    client = FakeClient()
+    discovery.publish(client, entities(), "one:1883")
+    assert discovery.publish(client, entities(), "two:1883") == 2
+
+
+def test_removed_entity_deleted(discovery):
+    client = FakeClient()
+    discovery.publish(client, entities(), "broker:1883")
+    assert discovery.publish(client, entities()[:1], "broker:1883") == 1
+    assert client.published[-1] == (
+        "homeassistant/camera/node/pc_screenshot/config", "", 1, True)
+
+
+def test_failed_publish_not_cached(discovery):
+    discovery.publish(FakeClient(rc=4), entities(), "broker:1883")
+    assert discovery.publish(FakeClient(), entities(), "broker:1883") == 2
+
+
+def test_cache_persisted(discovery, tmp_path):
+    discovery.publish(FakeClient(), entities(), "broker:1883")
+    cache_file = tmp_path / "discovery.json"
+    assert set(json.loads(cache_file.read_text())["broker:1883"]) == {
+        "homeassistant/sensor/node/pc/config",
+        "homeassistant/camera/node/pc_screenshot/config"}
+    reloaded = HADiscovery("homeassistant", "node", cache_file)
+    assert reloaded.publish(FakeClient(), entities(), "broker:1883") == 0
+
+
+def test_invalid_cache_ignored(tmp_path):
+    cache_file = tmp_path / "discovery.json"
+    cache_file.write_text("not json")
+    discovery = HADiscovery("homeassistant", "node", cache_file)
+    assert discovery.publish(FakeClient(), entities(), "broker:1883") == 2
@@ -0,0 +1,59 @@
+import pytest
+
+from eventtrace import MAGIC, RecordType, TraceRecorder, read_trace
+
+
+def test_round_trip(tmp_path):
+    filename = tmp_path / "trace.bin"
+    recorder = TraceRecorder(filename)
+    recorder.record_input(1.0)
+    recorder.record_window(2.0, "Editor – ünïcode")
+    recorder.record_capture(3.0, 0.25, 1234, 0xDEADBEEF)
+    recorder.close()
+
+    records = list(read_trace(filename))
+    assert [record.type for record in records] == [
+        RecordType.INPUT, RecordType.WINDOW, RecordType.CAPTURE]
+    assert [record.timestamp for record in records] == [1.0, 2.0, 3.0]
+    assert records[0].value is None
+    assert records[1].value == "Editor – ünïcode"
+    assert records[2].value == (0.25, 1234, 0xDEADBEEF)
+
+
+def test_unchanged_title_not_recorded(tmp_path):
+    filename = tmp_path / "trace.bin"
+    recorder = TraceRecorder(filename)
+    for timestamp, title in enumerate(["a", "a", "b", "a"]):
+        recorder.record_window(timestamp, title)
+    recorder.close()
+    assert [record.value for record in read_trace(filename)] == \
+        ["a", "b", "a"]
+
+
+def test_appends_to_existing_trace(tmp_path):
+    filename = tmp_path / "trace.bin"
+    for timestamp in (1.0, 2.0):
+        recorder = TraceRecorder(filename)
+        recorder.record_input(timestamp)
+        recorder.close()
+    assert filename.read_bytes().count(MAGIC) == 1
+    assert [record.timestamp for record in read_trace(filename)] == \
+        [1.0, 2.0]
+
+
+def test_truncated_record_ignored(tmp_path):
+    filename = tmp_path / "trace.bin"
+    recorder = TraceRecorder(filename)
+    recorder.record_input(1.0)
+    recorder.record_capture(2.0, 0.1, 10, 0)
+    recorder.close()
+    filename.write_bytes(filename.read_bytes()[:-3])
+    assert [record.type for record in read_trace(filename)] == \
+        [RecordType.INPUT]
+
+
+def test_not_a_trace(tmp_path):
+    filename = tmp_path / "other.bin"
+    filename.write_bytes(b"something else")
+    with pytest.raises(ValueError):
+        list(read_trace(filename))
@@ -0,0 +1,52 @@
+from history import ENTRY_OVERHEAD, FrameHistory
+
+
+def test_closest_frame():
+    history = FrameHistory(10000)
+    for timestamp in (10.0, 20.0, 30.0):
+        history.add(timestamp, str(timestamp).encode())
+    assert history.closest(5.0) == (10.0, b"10.0")
+    assert history.closest(14.0) == (10.0, b"10.0")
+    assert history.closest(16.0) == (20.0, b"20.0")
+    assert history.closest(99.0) == (30.0, b"30.0")
+    assert history.timestamps() == [10.0, 20.0, 30.0]
+
+
+def test_closest_when_empty():
+    assert FrameHistory(1000).closest(1.0) is None
+
+
+def test_oldest_dropped_to_stay_within_budget():
+    history = FrameHistory(3 * (100 + ENTRY_OVERHEAD))
+    for timestamp in range(5):
+        history.add(timestamp, bytes([timestamp]) * 100)
+    assert history.timestamps() == [2, 3, 4]
+    assert history.size <= history.budget
+
+
+def test_identical_frames_stored_once():
+    history = FrameHistory(10000)
+    for timestamp in range(3):
+        history.add(timestamp, b"same" * 100)
+    assert len(history) == 3
+    assert history.size == 400 + 3 * ENTRY_OVERHEAD
+    assert history.closest(0) == (0, b"same" * 100)
+
+
+def test_resize_trims():
+    history = FrameHistory(10000)
+    for timestamp in range(4):
+        history.add(timestamp, bytes([timestamp]) * 100)
+    history.resize(100 + ENTRY_OVERHEAD)
+    assert history.timestamps() == [3]
+
+
+def test_shed_keeps_budget():
+    history = FrameHistory(10000)
+    for timestamp in range(4):
+        history.add(timestamp, bytes([timestamp]) * 100)
+    size = history.size
+    assert history.shed() == size - history.size
+    assert history.size <= size // 2
+    assert history.timestamps() == [2, 3]
+    assert history.budget == 10000
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("psutil")
+
+import idle  # noqa: E402
+
+
+class FakeX11IdleSource(idle.IdleSource):
+    def __init__(self):
+        pass
+
+
+def unavailable():
+    raise OSError("no display")
+
+
+@pytest.fixture
+def linux(monkeypatch):
+    monkeypatch.setattr(idle, "WINDOWS", False)
+    monkeypatch.setattr(idle, "LINUX", True)
+    return monkeypatch
+
+
+def test_hooks_requested(linux):
+    linux.setattr(idle, "X11IdleSource", FakeX11IdleSource)
+    assert isinstance(idle.create_idle_source("hooks"), idle.HookIdleSource)
+
+
+def test_os_source_preferred(linux):
+    linux.setattr(idle, "X11IdleSource", FakeX11IdleSource)
+    assert isinstance(idle.create_idle_source(), FakeX11IdleSource)
+
+
+def test_auto_falls_back_to_hooks(linux):
+    linux.setattr(idle, "X11IdleSource", unavailable)
+    assert isinstance(idle.create_idle_source("auto"), idle.HookIdleSource)
+
+
+def test_os_only_raises(linux):
+    linux.setattr(idle, "X11IdleSource", unavailable)
+    with pytest.raises(OSError):
+        idle.create_idle_source("os")
+
+
+def test_unknown_platform_uses_hooks(monkeypatch):
+    monkeypatch.setattr(idle, "WINDOWS", False)
+    monkeypatch.setattr(idle, "LINUX", False)
+    assert isinstance(idle.create_idle_source(), idle.HookIdleSource)
+
+
+def test_sources_polled_or_event_driven():
+    assert idle.IdleSource.polled
+    assert idle.IdleSource().idle_seconds() is None
+    assert not idle.HookIdleSource.polled
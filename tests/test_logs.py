@@ -0,0 +1,70 @@
+import logging
+
+import pytest
+
+import logs
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(logs.time, "monotonic", fake.monotonic)
+    return fake
+
+
+def record(msg, *args, name="test", level=logging.INFO):
+    return logging.LogRecord(name, level, __file__, 0, msg, args, None)
+
+
+def test_burst_then_suppressed(clock):
+    rate_filter = logs.RateLimitFilter(burst=2, period=60)
+    allowed = [rate_filter.filter(record("retry %d", n)) for n in range(5)]
+    assert allowed == [True, True, False, False, False]
+    # other messages are counted separately
+    assert rate_filter.filter(record("other"))
+    assert rate_filter.filter(record("retry %d", 0, level=logging.WARNING))
+
+
+def test_suppressed_count_on_next_period(clock):
+    rate_filter = logs.RateLimitFilter(burst=1, period=60)
+    for n in range(3):
+        rate_filter.filter(record("retry %d", n))
+    clock.now += 60
+    next_record = record("retry %d", 3)
+    assert rate_filter.filter(next_record)
+    assert "[2 similar messages suppressed]" in next_record.getMessage()
+
+
+def test_expired_keys_pruned_and_reported(clock):
+    reported = []
+    rate_filter = logs.RateLimitFilter(burst=1, period=60,
+                                       report=reported.append)
+    for n in range(3):
+        rate_filter.filter(record("storm %d", n))
+    rate_filter.filter(record("quiet"))
+    clock.now += 61
+    rate_filter.filter(record("later"))
+    assert list(rate_filter._keys) == [("test", logging.INFO, "later")]
+    assert [report.getMessage() for report in reported] == \
+        ["2 similar messages suppressed: storm %d"]
+    assert reported[0].name == "test"
+
+
+def test_set_level():
+    root = logging.getLogger()
+    level = root.level
+    try:
+        assert logs.set_level(" debug ")
+        assert root.level == logging.DEBUG
+        assert not logs.set_level("LOUD")
+        assert root.level == logging.DEBUG
+    finally:
+        root.setLevel(level)
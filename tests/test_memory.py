@@ -0,0 +1,69 @@
+import tracemalloc
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("psutil")
+
+import memory  # noqa: E402
+from memory import LeakSentinel, MemoryBudget  # noqa: E402
+
+
+class FakeProcess:
+    rss = 100 * 1048576
+
+    def memory_info(self):
+        return SimpleNamespace(rss=self.rss)
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    monkeypatch.setattr(memory.psutil, "Process", FakeProcess)
+    return MemoryBudget()
+
+
+def test_disabled_budget_never_over(budget):
+    assert budget.rss_mb() == 100
+    assert not budget.over_budget()
+
+
+def test_over_budget(budget):
+    budget.budget_mb = 200
+    assert not budget.over_budget()
+    budget.budget_mb = 50
+    assert budget.over_budget()
+
+
+@pytest.fixture
+def not_tracing():
+    if tracemalloc.is_tracing():
+        pytest.skip("tracemalloc already running")
+    yield
+    tracemalloc.stop()
+
+
+def test_leak_growth_reported(not_tracing):
+    sentinel = LeakSentinel(top=5)
+    assert sentinel.check() == []
+    sentinel.start()
+    assert sentinel.running
+    leak = [bytearray(1024) for _ in range(200)]
+    growth = sentinel.check()
+    assert any("test_memory.py:" in site and size >= 200 * 1024
+               for site, size, count in growth)
+    # nothing new since the last check
+    assert all(size < 200 * 1024 for _, size, _ in sentinel.check())
+    del leak
+    sentinel.stop()
+    assert not sentinel.running
+    assert not tracemalloc.is_tracing()
+
+
+def test_stop_leaves_tracing_started_elsewhere(not_tracing):
+    tracemalloc.start()
+    sentinel = LeakSentinel()
+    sentinel.start()
+    assert sentinel.running
+    sentinel.stop()
+    assert not sentinel.running
+    assert tracemalloc.is_tracing()
@@ -0,0 +1,88 @@
+import socket
+
+import pytest
+
+pytest.importorskip("paho.mqtt.client")
+pytest.importorskip("PySide2.QtCore")
+
+from mqtt import Broker, Mqtt  # noqa: E402
+
+
+PREFERRED = Broker("preferred", 1883)
+NEAR = Broker("near", 1883)
+FAR = Broker("far", 1883)
+
+
+@pytest.fixture
+def mqtt():
+    return Mqtt("test")
+
+
+def probing(mqtt, latencies):
+    # replace the tcp probe with fixed latencies, None is down
+    probed = []
+
+    def probe(broker):
+        probed.append(broker)
+        return latencies.get(broker)
+
+    mqtt.probe = probe
+    return probed
+
+
+def test_preferred_used_when_healthy(mqtt):
+    mqtt.brokers = [PREFERRED, FAR, NEAR]
+    probed = probing(mqtt, {PREFERRED: 0.5, FAR: 0.2, NEAR: 0.01})
+    assert mqtt.select_broker() == PREFERRED
+    # fallbacks aren't probed once the preferred answers
+    assert probed == [PREFERRED]
+
+
+def test_fastest_fallback_when_preferred_down(mqtt):
+    mqtt.brokers = [PREFERRED, FAR, NEAR]
+    probing(mqtt, {FAR: 0.2, NEAR: 0.01})
+    assert mqtt.select_broker() == NEAR
+
+
+def test_equal_latency_prefers_earlier_fallback(mqtt):
+    mqtt.brokers = [PREFERRED, FAR, NEAR]
+    probing(mqtt, {FAR: 0.1, NEAR: 0.1})
+    assert mqtt.select_broker() == FAR
+
+
+def test_preferred_when_none_healthy(mqtt):
+    mqtt.brokers = [PREFERRED, FAR]
+    probing(mqtt, {})
+    assert mqtt.select_broker() == PREFERRED
+
+
+def test_current_broker_without_list(mqtt):
+    mqtt.host, mqtt.port = NEAR
+    assert mqtt.select_broker() == NEAR
+
+
+def test_preferred_recovered(mqtt):
+    mqtt.brokers = [PREFERRED, FAR]
+    probing(mqtt, {PREFERRED: 0.1})
+    assert not mqtt.preferred_recovered()
+    mqtt.host, mqtt.port = FAR
+    assert mqtt.preferred_recovered()
+    probing(mqtt, {})
+    assert not mqtt.preferred_recovered()
+
+
+def test_probe_reports_down_broker(mqtt):
+    # a port nothing listens on, found by binding then closing it
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    mqtt.probe_timeout = 1
+    assert mqtt.probe(Broker("127.0.0.1", port)) is None
+
+
+def test_probe_measures_listening_broker(mqtt):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        latency = mqtt.probe(Broker(*sock.getsockname()))
+    assert latency is not None and latency >= 0
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+QtCore = pytest.importorskip("PySide2.QtCore")
+
+import notifications  # noqa: E402
+from notifications import NotificationQueue  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(notifications.time, "monotonic", fake.monotonic)
+    return fake
+
+
+@pytest.fixture
+def queue(app, clock):
+    shown = []
+    results = []
+    notification_queue = NotificationQueue(
+        lambda title, message: shown.append((title, message)),
+        lambda result: results.append(json.loads(result)),
+        rate=2, period=60, max_queued=3)
+    notification_queue.shown = shown
+    notification_queue.results = results
+    yield notification_queue
+    notification_queue._timer.stop()
+
+
+def payload(title, message="message", notification_id=None):
+    notification = {"title": title, "message": message}
+    if notification_id is not None:
+        notification["id"] = notification_id
+    return json.dumps(notification).encode()
+
+
+def test_single_notification_delivered(queue):
+    queue.submit(payload("a", "hello", 1))
+    # only the final status is published
+    assert queue.results == []
+    queue.flush()
+    assert queue.shown == [("a", "hello")]
+    assert queue.results == [{"id": 1, "status": "delivered"}]
+
+
+def test_same_title_coalesced(queue):
+    queue.submit(payload("a", "same", 1))
+    queue.submit(payload("a", "same", 2))
+    queue.submit(payload("b", "one", 3))
+    queue.submit(payload("b", "two", 4))
+    queue.flush()
+    assert queue.shown == [("a", "same (x2)"), ("b", "2 new messages")]
+    assert queue.results == [{"id": notification_id, "status": "coalesced"}
+                             for notification_id in (1, 2, 3, 4)]
+
+
+def test_rate_limited(queue, clock):
+    for title in "abc":
+        queue.submit(payload(title))
+    queue.flush()
+    assert [title for title, _ in queue.shown] == ["a", "b"]
+    # c waits until the period has passed
+    clock.now += 30
+    queue.flush()
+    assert len(queue.shown) == 2
+    clock.now += 30
+    queue.flush()
+    assert [title for title, _ in queue.shown] == ["a", "b", "c"]
+
+
+def test_flood_of_one_title_does_not_crowd_out_others(queue):
+    for notification_id in range(500):
+        queue.submit(payload("a", "storm", notification_id))
+    queue.submit(payload("b", "important", "b"))
+    queue.submit(payload("c", "important", "c"))
+    assert not any(result["status"] == "dropped" for result in queue.results)
+    queue.flush()
+    others = [result for result in queue.results
+              if result["id"] in ("b", "c")]
+    assert queue.shown == [("a", "storm (x500)"), ("b", "important")]
+    # c waits for the rate limit
+    assert others == [{"id": "b", "status": "delivered"}]
+    # every id of the flood is acknowledged once
+    flood = [result["id"] for result in queue.results
+             if result["id"] not in ("b", "c")]
+    assert sorted(flood) == list(range(500))
+
+
+def test_too_many_titles_dropped(queue):
+    for title in "abcd":
+        queue.submit(payload(title, notification_id=title))
+    assert queue.results == [{"id": "d", "status": "dropped",
+                              "reason": "queue full"}]
+
+
+@pytest.mark.parametrize("data, reason", [
+    (b"x" * 5000, "payload too large"),
+    (b"not json", "payload is not a json object"),
+    (b"{oops", "invalid json"),
+    (b"[" * 2000 + b"]" * 2000, "payload is not a json object"),
+    (b'{"a":' + b"[" * 3000, "json nested too deeply"),
+    (b'{"title": 1, "message": "m"}', "title and message must be strings"),
+], ids=["large", "not object", "invalid", "array", "nested", "types"])
+def test_rejected(queue, data, reason):
+    queue.submit(data)
+    assert queue.results == [{"id": None, "status": "rejected",
+                              "reason": reason}]
+    queue.flush()
+    assert queue.shown == []
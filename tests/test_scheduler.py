@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("psutil")
+
+from scheduler import AdaptiveScheduler  # noqa: E402
+
+
+class FixedScheduler(AdaptiveScheduler):
+    def __init__(self, cpu=0.0, battery=False, **kwargs):
+        super().__init__(**kwargs)
+        self.cpu = cpu
+        self.battery = battery
+
+    def cpu_percent(self):
+        return self.cpu
+
+    def on_battery(self):
+        return self.battery
+
+
+@pytest.fixture
+def scheduler():
+    return AdaptiveScheduler(min_interval=5, max_interval=300)
+
+
+@pytest.mark.parametrize("cpu, factor", [
+    (0, 1.0), (75, 1.0), (87.5, 2.5), (100, 4.0)])
+def test_cpu_curve(scheduler, cpu, factor):
+    assert scheduler.factor(cpu, False, None) == pytest.approx(factor)
+
+
+def test_battery_factor(scheduler):
+    assert scheduler.factor(0, True, None) == scheduler.battery_factor
+
+
+@pytest.mark.parametrize("change_rate, factor", [
+    (None, 1.0), (0.0, 2.0), (1.0, 0.5)])
+def test_change_rate(scheduler, change_rate, factor):
+    assert scheduler.factor(0, False, change_rate) == pytest.approx(factor)
+
+
+def test_change_rate_unknown_until_two_screenshots(scheduler):
+    assert scheduler.change_rate is None
+    scheduler.record_digest(b"a")
+    assert scheduler.change_rate is None
+    for digest in (b"a", b"b", b"b", b"c"):
+        scheduler.record_digest(digest)
+    assert scheduler.change_rate == 0.5
+
+
+def test_change_history_bounded():
+    scheduler = AdaptiveScheduler(history=3)
+    for digest in (b"a", b"b", b"c", b"c", b"c", b"c"):
+        scheduler.record_digest(digest)
+    assert scheduler.change_rate == 0.0
+
+
+def test_interval_neutral_without_data():
+    assert FixedScheduler().interval(15) == 15
+
+
+def test_interval_clamped():
+    busy = FixedScheduler(cpu=100, battery=True, min_interval=5,
+                          max_interval=60)
+    assert busy.interval(30) == 60
+    changing = FixedScheduler(min_interval=10, max_interval=300)
+    for digest in (b"a", b"b", b"c"):
+        changing.record_digest(digest)
+    assert changing.interval(15) == 10
@@ -0,0 +1,130 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("psutil")
+
+import sensors  # noqa: E402
+from sensors import SystemSensors  # noqa: E402
+
+
+CpuTimes = namedtuple("CpuTimes", ["user", "system", "idle", "iowait",
+                                   "guest", "guest_nice"])
+
+
+class FakeProcess:
+    def __init__(self):
+        self.cpu_calls = 0
+
+    @contextmanager
+    def oneshot(self):
+        yield
+
+    def cpu_percent(self):
+        self.cpu_calls += 1
+        return 0.0 if self.cpu_calls == 1 else 12.5
+
+    def memory_info(self):
+        return SimpleNamespace(rss=50 * 1048576)
+
+
+class FakePsutil:
+    '''psutil counters the test moves on between samples'''
+
+    def __init__(self):
+        self.cpu = CpuTimes(100, 50, 850, 0, 0, 0)
+        self.disk = SimpleNamespace(read_bytes=1000, write_bytes=2000)
+        self.net = SimpleNamespace(bytes_recv=5000, bytes_sent=3000)
+
+    def Process(self):
+        return FakeProcess()
+
+    def cpu_times(self):
+        return self.cpu
+
+    def virtual_memory(self):
+        return SimpleNamespace(percent=40.0)
+
+    def disk_usage(self, path):
+        return SimpleNamespace(percent=70.0)
+
+    def disk_io_counters(self):
+        return self.disk
+
+    def net_io_counters(self):
+        return self.net
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return 0.0
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    psutil = FakePsutil()
+    clock = FakeClock()
+    monkeypatch.setattr(sensors, "psutil", psutil)
+    monkeypatch.setattr(sensors, "time", clock)
+    return psutil, clock
+
+
+def test_first_sample_has_no_rates_or_cpu(fake):
+    values = SystemSensors().sample()
+    assert values == {"mem": 40.0, "disk": 70.0, "proc_rss": 50.0,
+                      "sample_ms": 0.0}
+
+
+def test_rates_and_cpu_from_deltas(fake):
+    psutil, clock = fake
+    system_sensors = SystemSensors()
+    system_sensors.sample()
+    clock.now += 10
+    # 100 of 200 ticks busy, iowait counts as idle, guest is in user
+    psutil.cpu = CpuTimes(180, 70, 920, 30, 40, 0)
+    psutil.disk = SimpleNamespace(read_bytes=11000, write_bytes=2000)
+    psutil.net = SimpleNamespace(bytes_recv=6000, bytes_sent=3500)
+    values = system_sensors.sample()
+    assert values["cpu"] == 50.0
+    assert values["disk_read"] == 1000
+    assert values["disk_write"] == 0
+    assert values["net_rx"] == 100
+    assert values["net_tx"] == 50
+    assert values["proc_cpu"] == 12.5
+
+
+def test_counter_reset_not_negative(fake):
+    psutil, clock = fake
+    system_sensors = SystemSensors(["network"])
+    system_sensors.sample()
+    clock.now += 1
+    psutil.net = SimpleNamespace(bytes_recv=0, bytes_sent=0)
+    assert system_sensors.sample()["net_rx"] == 0
+
+
+def test_only_enabled_sensors(fake):
+    system_sensors = SystemSensors(["memory"])
+    assert system_sensors.fields() == [("mem", "Memory Used", "%",
+                                        "mdi:memory")]
+    assert set(system_sensors.sample()) == {"mem", "sample_ms"}
+
+
+def test_unknown_sensor(fake):
+    with pytest.raises(ValueError, match="unknown sensors: gpu"):
+        SystemSensors(["cpu", "gpu"])
+
+
+def test_interval_stretched_by_cost(fake):
+    system_sensors = SystemSensors()
+    system_sensors.cost = 0.5
+    assert system_sensors.interval(30) == 50
+    system_sensors.cost = 0.01
+    assert system_sensors.interval(30) == 30
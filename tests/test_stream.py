@@ -0,0 +1,110 @@
+import socket
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from stream import FrameSource, MjpegServer
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_frames_only_captured_while_clients_connected():
+    captures = []
+
+    def capture():
+        captures.append(None)
+        return b"frame%d" % len(captures)
+
+    source = FrameSource(capture, fps=100)
+    source.add_client()
+    sequence, frame = source.wait_frame(0)
+    assert sequence >= 1 and frame.startswith(b"frame")
+    newer, _ = source.wait_frame(sequence)
+    assert newer > sequence
+    source.remove_client()
+    assert wait_until(lambda: source._thread is None)
+    count = len(captures)
+    time.sleep(0.05)
+    assert len(captures) == count
+
+
+def test_wait_frame_times_out_without_frames():
+    source = FrameSource(lambda: None, fps=100)
+    source.add_client()
+    try:
+        assert source.wait_frame(0, timeout=0.05) == (0, None)
+    finally:
+        source.remove_client()
+
+
+def test_capture_errors_do_not_stop_source():
+    calls = []
+
+    def capture():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("grab failed")
+        return b"frame"
+
+    source = FrameSource(capture, fps=100)
+    source.add_client()
+    try:
+        assert source.wait_frame(0)[1] == b"frame"
+    finally:
+        source.remove_client()
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(capture, token=None):
+        mjpeg = MjpegServer(capture, 0, 50, "127.0.0.1", token)
+        mjpeg.start()
+        servers.append(mjpeg)
+        return mjpeg
+
+    yield start
+    for mjpeg in servers:
+        mjpeg.stop()
+
+
+def test_snapshot(server):
+    mjpeg = server(lambda: b"jpeg")
+    url = f"http://127.0.0.1:{mjpeg.port}/snapshot.jpg"
+    with urllib.request.urlopen(url, timeout=5) as response:
+        assert response.read() == b"jpeg"
+
+
+def test_token_required(server):
+    mjpeg = server(lambda: b"jpeg", token="secret")
+    base = f"http://127.0.0.1:{mjpeg.port}/snapshot.jpg"
+    with pytest.raises(urllib.error.HTTPError) as err:
+        urllib.request.urlopen(base, timeout=5)
+    assert err.value.code == 403
+    with urllib.request.urlopen(base + "?token=secret", timeout=5) as response:
+        assert response.read() == b"jpeg"
+    assert mjpeg.url().endswith(
+        f":{mjpeg.port}/stream.mjpg?token=secret")
+    assert mjpeg.url().startswith("http://127.0.0.1:")
+
+
+def test_disconnected_client_stops_capture(server):
+    mjpeg = server(lambda: None)
+    client = socket.create_connection(("127.0.0.1", mjpeg.port), 5)
+    client.sendall(b"GET /stream.mjpg HTTP/1.0\r\n\r\n")
+    assert client.recv(15) == b"HTTP/1.0 200 OK"
+    assert wait_until(lambda: mjpeg.source.clients == 1)
+    client.close()
+    # noticed when the wait for a frame times out
+    assert wait_until(lambda: mjpeg.source.clients == 0, timeout=10)
+    assert wait_until(lambda: mjpeg.source._thread is None)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# watcher.py
+# written by Malcolm Dixon 2020
+# class to detect foreground window and title changes
+
+import time
+from PySide2.QtCore import QObject, QTimer, Signal, Slot
+
+
+class WindowWatcher(QObject):
+    '''Signals once the foreground window or its title settles on a change
+
+    The platform backend is polled every poll_interval ms, a change
+    (re)starts the debounce timer so window_changed is only emitted when
+    no further change is seen for debounce ms. Changes of title alone
+    e.g. a ticking clock or progress, are emitted at most every
+    title_interval ms. window_changed carries the title and whether the
+    foreground window switched rather than only its title changing.
+    title_changed is emitted on every poll that sees a new title, without
+    debouncing, e.g. for recording.
+    '''
+
+    window_changed = Signal(str, bool)
+    title_changed = Signal(str)
+
+    def __init__(self, get_active_window, get_window_title,
+                 poll_interval: int = 250, debounce: int = 500,
+                 title_interval: int = 60000):
+        super().__init__()
+        self._get_active_window = get_active_window
+        self._get_window_title = get_window_title
+        self.title_interval = title_interval
+        self._window = None
+        self._title = None
+        # set when the foreground window itself changed since the last emit
+        self._switched = False
+        self._last_emit = None
+        self._debounce = debounce
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(poll_interval)
+        self._poll_timer.timeout.connect(self.poll)
+        self._debounce_timer = QTimer(self)
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.timeout.connect(self._settled)
+
+    @property
+    def poll_interval(self) -> int:
+        return self._poll_timer.interval()
+
+    @poll_interval.setter
+    def poll_interval(self, value: int):
+        self._poll_timer.setInterval(value)
+
+    @property
+    def debounce(self) -> int:
+        return self._debounce
+
+    @debounce.setter
+    def debounce(self, value: int):
+        self._debounce = value
+
+    @property
+    def active(self) -> bool:
+        return self._poll_timer.isActive()
+
+    def start(self):
+        # the current window is the baseline, not a change
+        self._window = self._get_active_window()
+        self._title = self._get_window_title()
+        self.title_changed.emit(self._title or "")
+        self._poll_timer.start()
+
+    def stop(self):
+        self._poll_timer.stop()
+        self._debounce_timer.stop()
+
+    @Slot()
+    def poll(self):
+        window = self._get_active_window()
+        title = self._get_window_title()
+        if window != self._window or title != self._title:
+            if window != self._window:
+                self._switched = True
+            if title != self._title:
+                self.title_changed.emit(title or "")
+            self._window = window
+            self._title = title
+            self._debounce_timer.start(self._debounce)
+
+    @Slot()
+    def _settled(self):
+        now = time.monotonic()
+        if not self._switched and self._last_emit is not None:
+            # hold back a title only change until title_interval has passed
+            wait = self._last_emit + self.title_interval / 1000 - now
+            if wait > 0:
+                self._debounce_timer.start(int(wait * 1000) + 1)
+                return
+        switched = self._switched
+        self._switched = False
+        self._last_emit = now
+        self.window_changed.emit(self._title or "", switched)